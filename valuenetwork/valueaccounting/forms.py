@@ -6,6 +6,7 @@ from django.utils.translation import ugettext_lazy as _
 from valuenetwork.tekextensions.widgets import SelectWithPopUp
 
 from valuenetwork.valueaccounting.models import *
+from valuenetwork.valueaccounting.utils import xbill_choices
 from valuenetwork.valueaccounting.widgets import DurationWidget
 
 
@@ -51,11 +52,11 @@ class OptionsForm(forms.Form):
 
     def __init__(self, feature, *args, **kwargs):
         super(OptionsForm, self).__init__(*args, **kwargs)
-        if feature.option_category:
-            options = EconomicResourceType.objects.filter(category=feature.option_category)
-        else:
-            options = EconomicResourceType.objects.all()
-        self.fields["options"].choices = [(rt.id, rt.name) for rt in options]
+        category_id = feature.option_category_id
+        self.fields["options"].choices = [
+            (rt_id, name) for rt_id, name, rt_category_id in xbill_choices()["resource_types"]
+            if not category_id or rt_category_id == category_id
+        ]
 
 class EconomicResourceTypeForm(forms.ModelForm):
     
@@ -83,7 +84,7 @@ class AgentResourceTypeForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         super(AgentResourceTypeForm, self).__init__(*args, **kwargs)
         self.fields["agent"].choices = [
-            (agt.id, agt.name) for agt in EconomicAgent.objects.all()
+            (agent_id, name) for agent_id, name in xbill_choices()["agents"]
         ]
         self.fields["relationship"].choices = [
             (rel.id, rel.name) for rel in ResourceRelationship.objects.filter(direction='out')
@@ -0,0 +1,67 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import simplejson
+
+from valuenetwork.valueaccounting.utils import TimelineEvent, stream_timeline_json, timeline_dates
+
+
+class Command(BaseCommand):
+    help = "Times serializing timeline events the old way, dictify and " \
+        "simplejson.dumps, against stream_timeline_json, on synthetic events."
+    args = "[event_count ...]"
+
+    def handle(self, *args, **options):
+        counts = [int(arg) for arg in args] or [100000]
+        self.stdout.write("%8s %-8s %10s %12s\n" % (
+            "events", "path", "seconds", "largest str"))
+        for count in counts:
+            rows = self.build_rows(count)
+
+            timeline_dates.clear()
+            start = time.time()
+            events = {"dateTimeFormat": "Gregorian", "events": []}
+            for row in rows:
+                te = TimelineEvent(None, row[2], row[3], row[4], row[5], row[6])
+                d = te.dictify()
+                d["id"] = row[0]
+                d["order"] = row[1]
+                events["events"].append(d)
+            data = simplejson.dumps(events, ensure_ascii=False)
+            elapsed = time.time() - start
+            self.stdout.write("%8d %-8s %10.3f %12d\n" % (
+                count, "dumps", elapsed, len(data)))
+            del events, data
+
+            timeline_dates.clear()
+            start = time.time()
+            largest = 0
+            for part in stream_timeline_json(iter(rows), next=None):
+                largest = max(largest, len(part))
+            elapsed = time.time() - start
+            self.stdout.write("%8d %-8s %10.3f %12d\n" % (
+                count, "stream", elapsed, largest))
+
+    def build_rows(self, count):
+        """
+        ``count`` TIMELINE_ROW_FIELDS tuples spread over a year, every
+        other one a duration event, like a busy shop's timeline.
+        """
+        first = datetime.date(2013, 1, 1)
+        rows = []
+        for i in range(count):
+            start = first + datetime.timedelta(days=i % 365)
+            end = None
+            if i % 2:
+                end = start + datetime.timedelta(days=3)
+            rows.append((
+                i + 1,
+                i / 20 + 1,
+                start,
+                end,
+                u"Part %s from Supplier to Make Product" % i,
+                u"http://example.com/processes/%s/" % i,
+                u"Step %s of the order" % i,
+            ))
+        return rows
@@ -0,0 +1,81 @@
+import time
+from decimal import Decimal
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from valuenetwork.valueaccounting.models import *
+from valuenetwork.valueaccounting.utils import generate_xbill, xbill_closure_suspended
+
+
+class Command(BaseCommand):
+    help = "Times generate_xbill and counts its queries on synthetic bills. " \
+        "The bills are built inside a transaction that is rolled back."
+    args = "[node_count ...]"
+    option_list = BaseCommand.option_list + (
+        make_option('--fan-out', action='store', dest='fan_out', type='int',
+            default=5, help='Inputs per process type (default 5)'),
+    )
+
+    @transaction.commit_manually
+    def handle(self, *args, **options):
+        sizes = [int(arg) for arg in args] or [100, 1000, 10000]
+        fan_out = options['fan_out']
+        try:
+            self.stdout.write("%8s %10s %10s %8s\n" % (
+                "nodes", "generated", "seconds", "queries"))
+            for size in sizes:
+                with xbill_closure_suspended():
+                    product = self.build_bill(size, fan_out)
+                connection.use_debug_cursor = True
+                connection.queries = []
+                start = time.time()
+                nodes = generate_xbill(product)
+                elapsed = time.time() - start
+                queries = len(connection.queries)
+                connection.use_debug_cursor = None
+                self.stdout.write("%8d %10d %10.3f %8d\n" % (
+                    size, len(nodes), elapsed, queries))
+        finally:
+            transaction.rollback()
+
+    def build_bill(self, size, fan_out):
+        """
+        Builds a bill of about ``size`` xbill nodes, breadth first:
+        every resource type gets a process type with ``fan_out`` inputs
+        until the node budget is spent.
+        """
+        produces, created = ResourceRelationship.objects.get_or_create(
+            name="produces", direction="out")
+        consumes, created = ResourceRelationship.objects.get_or_create(
+            name="consumes", direction="in")
+        product = EconomicResourceType(name="Benchmark %s" % size)
+        product.save()
+        queue = [product]
+        count = 0
+        while queue and count < size:
+            rt = queue.pop(0)
+            pt = ProcessType(name="Make %s" % rt.name)
+            pt.save()
+            ProcessTypeResourceType(
+                process_type=pt,
+                resource_type=rt,
+                relationship=produces,
+                quantity=Decimal("1"),
+            ).save()
+            count += 1
+            for i in range(fan_out):
+                if count >= size:
+                    break
+                part = EconomicResourceType(name="%s.%s" % (rt.name, i))
+                part.save()
+                ProcessTypeResourceType(
+                    process_type=pt,
+                    resource_type=part,
+                    relationship=consumes,
+                    quantity=Decimal("2"),
+                ).save()
+                queue.append(part)
+                count += 1
+        return product
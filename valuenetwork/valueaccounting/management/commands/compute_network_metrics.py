@@ -0,0 +1,26 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from valuenetwork.valueaccounting.utils import refresh_network_metrics
+
+
+class Command(BaseCommand):
+    help = "Computes the degree, betweenness and blocked products of every " \
+        "agent and resource type, if the network changed since the last run."
+    option_list = BaseCommand.option_list + (
+        make_option('--processes', action='store', dest='processes', type='int',
+            default=None, help='Worker processes (default one per cpu)'),
+        make_option('--force', action='store_true', dest='force',
+            default=False, help='Recompute even if the network is unchanged'),
+    )
+
+    @transaction.commit_on_success
+    def handle(self, *args, **options):
+        counts = refresh_network_metrics(options['processes'], options['force'])
+        if counts is None:
+            self.stdout.write("Network unchanged, nothing to compute\n")
+        else:
+            self.stdout.write("%(created)s created, %(updated)s updated, "
+                "%(deleted)s deleted network metrics\n" % counts)
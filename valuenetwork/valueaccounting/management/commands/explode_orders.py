@@ -0,0 +1,40 @@
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from valuenetwork.valueaccounting.utils import claim_order_job, run_order_job, \
+    requeue_order_jobs, ORDER_JOB_TIMEOUT
+
+
+class Command(BaseCommand):
+    help = "Works through the queued order explosions, waiting for more " \
+        "when the queue is empty unless --once is given. Jobs left running " \
+        "longer than --timeout, by a worker that died, are taken up again."
+    option_list = BaseCommand.option_list + (
+        make_option('--once', action='store_true', dest='once',
+            default=False, help='Stop when the queue is empty'),
+        make_option('--sleep', action='store', dest='sleep', type='float',
+            default=2.0, help='Seconds to wait for new jobs (default 2)'),
+        make_option('--timeout', action='store', dest='timeout', type='int',
+            default=ORDER_JOB_TIMEOUT,
+            help='Seconds after which a running job is claimed again (default %s)' % ORDER_JOB_TIMEOUT),
+        make_option('--requeue', action='store_true', dest='requeue',
+            default=False, help='First put all running jobs back in the queue'),
+    )
+
+    def handle(self, *args, **options):
+        if options['requeue']:
+            self.stdout.write("%s running jobs requeued\n" % requeue_order_jobs())
+        while True:
+            job = claim_order_job(options['timeout'])
+            if job is None:
+                if options['once']:
+                    return
+                time.sleep(options['sleep'])
+                continue
+            began = time.time()
+            job = run_order_job(job)
+            self.stdout.write("Order %s: %s, %s of %s items in %.2f seconds%s\n" % (
+                job.order_id, job.status, job.progress, job.total,
+                time.time() - began, job.error and " (%s)" % job.error or ""))
@@ -0,0 +1,31 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from valuenetwork.valueaccounting.utils import export_network, NETWORK_EXPORT_FORMATS
+
+
+class Command(BaseCommand):
+    help = "Writes the whole value network as dot, graphml or jsonl " \
+        "(json lines), a chunk of rows at a time."
+    option_list = BaseCommand.option_list + (
+        make_option('--format', action='store', dest='format',
+            default='dot', help='dot, graphml or jsonl (default dot)'),
+        make_option('--output', action='store', dest='output',
+            default=None, help='File to write instead of stdout'),
+    )
+
+    def handle(self, *args, **options):
+        format = options['format']
+        if not format in NETWORK_EXPORT_FORMATS:
+            raise CommandError("Unknown format %s, use one of %s" % (
+                format, ", ".join(sorted(NETWORK_EXPORT_FORMATS))))
+        out = self.stdout
+        if options['output']:
+            out = open(options['output'], 'wb')
+        try:
+            for line in export_network(format):
+                out.write(line)
+        finally:
+            if options['output']:
+                out.close()
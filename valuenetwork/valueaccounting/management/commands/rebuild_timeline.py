@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from valuenetwork.valueaccounting.models import Order
+from valuenetwork.valueaccounting.utils import rebuild_timeline_entries
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the TimelineEntry table for all or the given orders."
+    args = "[order_id ...]"
+
+    @transaction.commit_on_success
+    def handle(self, *args, **options):
+        orders = Order.objects.all()
+        if args:
+            orders = orders.filter(id__in=[int(arg) for arg in args])
+        order_count = 0
+        entry_count = 0
+        for order in orders.iterator():
+            entry_count += len(rebuild_timeline_entries(order))
+            order_count += 1
+        self.stdout.write("%s timeline entries for %s orders\n" % (entry_count, order_count))
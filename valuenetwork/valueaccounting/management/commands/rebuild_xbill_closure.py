@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from valuenetwork.valueaccounting.models import EconomicResourceType, XbillClosure
+from valuenetwork.valueaccounting.utils import rebuild_xbill_closure
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the XbillClosure table for all or the given resource types."
+    args = "[resource_type_id ...]"
+
+    @transaction.commit_on_success
+    def handle(self, *args, **options):
+        rts = EconomicResourceType.objects.all()
+        if args:
+            rts = rts.filter(id__in=[int(arg) for arg in args])
+        else:
+            XbillClosure.objects.all().delete()
+        rt_count = 0
+        row_count = 0
+        for rt in rts.iterator():
+            row_count += len(rebuild_xbill_closure(rt))
+            rt_count += 1
+        self.stdout.write("%s closure rows for %s resource types\n" % (row_count, rt_count))
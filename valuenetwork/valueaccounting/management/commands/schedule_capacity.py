@@ -0,0 +1,41 @@
+import datetime
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from valuenetwork.valueaccounting.models import Order
+from valuenetwork.valueaccounting.utils import CapacitySchedule
+
+
+class Command(BaseCommand):
+    help = "Reschedules the processes and work commitments of open orders, " \
+        "or the given ones, within the agents' work capacity."
+    args = "[order_id ...]"
+    option_list = BaseCommand.option_list + (
+        make_option('--start', action='store', dest='start',
+            default=None, help='First day to schedule on, YYYY-MM-DD (default today)'),
+        make_option('--dry-run', action='store_true', dest='dry_run',
+            default=False, help='Report the schedule without saving it'),
+    )
+
+    @transaction.commit_on_success
+    def handle(self, *args, **options):
+        start = None
+        if options['start']:
+            try:
+                start = datetime.datetime.strptime(options['start'], "%Y-%m-%d").date()
+            except ValueError:
+                raise CommandError("Bad start date %s" % options['start'])
+        orders = None
+        if args:
+            orders = Order.objects.filter(id__in=[int(arg) for arg in args])
+        began = time.time()
+        schedule = CapacitySchedule(orders, start)
+        schedule.forward()
+        if not options['dry_run']:
+            schedule.save()
+        self.stdout.write("%s processes scheduled in %.2f seconds, %s late, %s over capacity\n" % (
+            len(schedule.placed), time.time() - began,
+            len(schedule.late()), len(schedule.overloaded)))
@@ -83,6 +83,58 @@ def _slug_strip(value, separator=None):
         value = re.sub('%s+' % re_sep, separator, value)
     return re.sub(r'^%s+|%s+$' % (re_sep, re_sep), '', value)
 
+
+def batch_unique_slugify(instances, values, slug_field_name='slug',
+                   slug_separator='-'):
+    """
+    unique_slugify for a batch of new ``instances`` of one model, about
+    to be bulk_created, with ``values`` the values to slugify for each.
+
+    Looks up the slugs already taken in one query per hundred distinct
+    slugs, then numbers the rest in memory, instead of probing the
+    database for every instance.
+    """
+    if not instances:
+        return
+    model = instances[0].__class__
+    slug_field = model._meta.get_field(slug_field_name)
+    slug_len = slug_field.max_length
+    original_slugs = []
+    for value in values:
+        slug = slugify(value)
+        if slug_len:
+            slug = slug[:slug_len]
+        original_slugs.append(_slug_strip(slug, slug_separator))
+
+    # A numbered slug may be cut short to fit, so look up by prefix.
+    prefixes = set(original_slugs)
+    if slug_len:
+        prefixes = set(slug[:slug_len-6] for slug in prefixes)
+    prefixes = sorted(prefixes)
+    taken = set()
+    for i in range(0, len(prefixes), 100):
+        query = Q()
+        for prefix in prefixes[i:i+100]:
+            query |= Q(**{'%s__startswith' % slug_field_name: prefix})
+        taken.update(model._default_manager.filter(query).values_list(
+            slug_field_name, flat=True))
+
+    next_numbers = {}
+    for instance, original_slug in zip(instances, original_slugs):
+        slug = original_slug
+        next = next_numbers.get(original_slug, 2)
+        while not slug or slug in taken:
+            slug = original_slug
+            end = '-%s' % next
+            if slug_len and len(slug) + len(end) > slug_len:
+                slug = slug[:slug_len-len(end)]
+                slug = _slug_strip(slug, slug_separator)
+            slug = '%s%s' % (slug, end)
+            next += 1
+        next_numbers[original_slug] = next
+        taken.add(slug)
+        setattr(instance, slug_field.attname, slug)
+
 CATEGORIZATION_CHOICES = (
     ('Anything', _('Anything')),
     ('EconomicResourceType', _('EconomicResourceType')),
@@ -422,6 +474,10 @@ class EconomicResourceType(models.Model):
     def xbill_category(self):
         return self.category
 
+    def rolled_up_cost(self):
+        from valuenetwork.valueaccounting.utils import xbill_cost
+        return xbill_cost(self)
+
     def change_form(self):
         from valuenetwork.valueaccounting.forms import EconomicResourceTypeForm
         return EconomicResourceTypeForm(instance=self)
@@ -514,6 +570,9 @@ class AgentResourceType(models.Model):
     unit_of_value = models.ForeignKey(Unit, blank=True, null=True,
         limit_choices_to={'unit_type': 'value'},
         verbose_name=_('unit of value'), related_name="agent_resource_value_units")
+    capacity = models.DecimalField(_('capacity'), max_digits=8, decimal_places=2,
+        default=Decimal("8.0"),
+        help_text=_("for types of work, hours per day the agent can give"))
 
     def __unicode__(self):
         return ' '.join([
@@ -549,6 +608,9 @@ class AgentResourceType(models.Model):
     def xbill_category(self):
         return Category(name="sources")
 
+    def xbill_quantity(self):
+        return Decimal("1")
+
     def xbill_parent_object(self):
         if self.relationship.direction == 'out':
             return self.resource_type
@@ -754,6 +816,12 @@ class ProcessTypeResourceType(models.Model):
         else:
             return self.resource_type.category
 
+    def xbill_quantity(self):
+        if self.relationship.direction == 'out':
+            return Decimal("1")
+        else:
+            return self.quantity
+
     def node_id(self):
         return "-".join(["ProcessResource", str(self.id)])
 
@@ -804,13 +872,15 @@ class Process(models.Model):
             self.start_date.strftime('%Y-%m-%d'),
             ])
 
-    def save(self, *args, **kwargs):
-        slug = "-".join([
+    def slug_value(self):
+        return "-".join([
             self.process_type.name,
             self.name,
             self.start_date.strftime('%Y-%m-%d'),
         ])
-        unique_slugify(self, slug)
+
+    def save(self, *args, **kwargs):
+        unique_slugify(self, self.slug_value())
         super(Process, self).save(*args, **kwargs)
 
     def label(self):
@@ -883,6 +953,9 @@ class Feature(models.Model):
     def xbill_category(self):
         return Category(name="features")
 
+    def xbill_quantity(self):
+        return self.quantity
+
     def node_id(self):
         return "-".join(["Feature", str(self.id)])
 
@@ -941,6 +1014,9 @@ class Option(models.Model):
     def xbill_category(self):
         return Category(name="features")
 
+    def xbill_quantity(self):
+        return Decimal("1")
+
     def node_id(self):
         return "-".join(["Option", str(self.id)])
 
@@ -948,6 +1024,75 @@ class Option(models.Model):
         return [self.feature, self]
 
 
+class XbillClosure(models.Model):
+    """One path from a resource type down to a node of its extended bill.
+
+    There is a row for every (ancestor, node, path) in the bill that
+    generate_xbill would build for the ancestor, so the whole bill can
+    be read back in one indexed query ordered by ``path``.
+    ``quantity`` is the product of the xbill quantities along the path,
+    i.e. how much of the node's child object one ancestor needs.
+
+    The rows are kept up to date by the signal handlers at the bottom
+    of this module.  ``manage.py rebuild_xbill_closure`` rebuilds them
+    for existing data.
+
+    ``path`` has a 4 digit sibling index per level, so a bill can
+    have at most 51 levels and 10000 children per node here (see
+    XBILL_CLOSURE_MAX_DEPTH in utils).  A bill past that has no rows,
+    and is built from the recipe each time.
+    """
+    ancestor = models.ForeignKey(EconomicResourceType,
+        verbose_name=_('ancestor'), related_name='xbill_descendants')
+    node_id = models.CharField(_('node id'), max_length=64, db_index=True)
+    child_id = models.CharField(_('child id'), max_length=64, db_index=True)
+    depth = models.IntegerField(_('depth'))
+    path = models.CharField(_('path'), max_length=255)
+    quantity = models.DecimalField(_('quantity'), max_digits=24, decimal_places=6,
+        default=Decimal("1"))
+
+    class Meta:
+        ordering = ('ancestor', 'path')
+        unique_together = ('ancestor', 'path')
+
+    def __unicode__(self):
+        return " ".join([self.ancestor.name, self.path, self.node_id])
+
+
+class NetworkMetric(models.Model):
+    """Centrality and supply risk of an agent or resource type.
+
+    ``degree`` counts the node's neighbours in the whole value network,
+    ``betweenness`` the shortest paths between other nodes that pass
+    through it, and ``blocked_products`` the end products that could
+    no longer be made if it failed: every source of a resource type,
+    or any input of a process type, gone.
+
+    The rows are computed by ``manage.py compute_network_metrics``,
+    see refresh_network_metrics in utils.
+    """
+    node_id = models.CharField(_('node id'), max_length=64, unique=True)
+    agent = models.ForeignKey(EconomicAgent,
+        blank=True, null=True,
+        verbose_name=_('agent'), related_name='network_metrics')
+    resource_type = models.ForeignKey(EconomicResourceType,
+        blank=True, null=True,
+        verbose_name=_('resource type'), related_name='network_metrics')
+    degree = models.IntegerField(_('degree'), default=0)
+    betweenness = models.FloatField(_('betweenness'), default=0.0)
+    blocked_products = models.IntegerField(_('blocked products'), default=0)
+    network_version = models.BigIntegerField(_('network version'), default=0)
+
+    class Meta:
+        ordering = ('-blocked_products', '-betweenness')
+
+    def __unicode__(self):
+        return self.node_id
+
+    def node(self):
+        return self.agent or self.resource_type
+
+
 class Order(models.Model):
     receiver = models.ForeignKey(EconomicAgent,
         blank=True, null=True,
@@ -1094,16 +1239,18 @@ class Commitment(models.Model):
               prefix = "with options"
         return " ".join([prefix, names])    
 
-    def save(self, *args, **kwargs):
+    def slug_value(self):
         from_id = "Unassigned"
-        if self.from_agent:
-            from_id = str(self.from_agent.id)
-        slug = "-".join([
-            str(self.event_type.id),
+        if self.from_agent_id:
+            from_id = str(self.from_agent_id)
+        return "-".join([
+            str(self.event_type_id),
             from_id,
             self.due_date.strftime('%Y-%m-%d'),
         ])
-        unique_slugify(self, slug)
+
+    def save(self, *args, **kwargs):
+        unique_slugify(self, self.slug_value())
         super(Commitment, self).save(*args, **kwargs)
 
     def timeline_title(self):
@@ -1122,6 +1269,108 @@ class Commitment(models.Model):
             process,
         ])
 
+class TimelineEntry(models.Model):
+    """One event of an order's schedule on the timeline.
+
+    The events backschedule_order finds for each order, stored so the
+    timeline is one range query on ``start`` and ``end``.
+    ``node_id`` is the model name and id of the order, commitment or
+    process the event shows, ``position`` its place in the order's
+    schedule.
+
+    The rows are kept up to date by the signal handlers at the bottom
+    of this module.  ``manage.py rebuild_timeline`` rebuilds them for
+    existing data.
+    """
+    order = models.ForeignKey(Order,
+        verbose_name=_('order'), related_name='timeline_entries')
+    position = models.IntegerField(_('position'))
+    node_id = models.CharField(_('node id'), max_length=64, db_index=True)
+    kind = models.CharField(_('kind'), max_length=32)
+    start = models.DateField(_('start'), db_index=True)
+    end = models.DateField(_('end'), blank=True, null=True, db_index=True)
+    title = models.TextField(_('title'))
+    link = models.CharField(_('link'), max_length=255, blank=True)
+    description = models.TextField(_('description'), blank=True)
+
+    class Meta:
+        ordering = ('start', 'id')
+
+    def __unicode__(self):
+        return self.title
+
+
+class TimelineChange(models.Model):
+    """When the TimelineEntries of an order last changed.
+
+    Kept after the order is deleted, so json_timeline?since= can tell
+    pollers to drop its events.
+    """
+    order_id = models.IntegerField(_('order id'), unique=True)
+    changed = models.DateTimeField(_('changed'), db_index=True)
+
+    def __unicode__(self):
+        return " ".join(["Order", str(self.order_id), self.changed.isoformat()])
+
+
+class CacheVersion(models.Model):
+    """The version of some cached data, bumped by the signal handlers
+    below whenever what it was derived from changes.
+
+    Kept in the database, not the cache, so every web worker and
+    management command sees the same versions.
+    """
+    name = models.CharField(_('name'), max_length=64, unique=True)
+    version = models.BigIntegerField(_('version'), default=0)
+
+    def __unicode__(self):
+        return " ".join([self.name, str(self.version)])
+
+
+JOB_STATUS_CHOICES = (
+    ('pending', _('pending')),
+    ('running', _('running')),
+    ('done', _('done')),
+    ('failed', _('failed')),
+)
+
+class OrderJob(models.Model):
+    """An order waiting for the explode_orders worker to plan it.
+
+    ``lines`` is the json list of the order's items and their options;
+    ``progress`` counts the lines planned so far, out of ``total``.
+    """
+    order = models.ForeignKey(Order,
+        related_name="jobs", verbose_name=_('order'))
+    status = models.CharField(_('status'), max_length=12,
+        choices=JOB_STATUS_CHOICES, default='pending', db_index=True)
+    lines = models.TextField(_('lines'))
+    total = models.IntegerField(_('total'), default=0)
+    progress = models.IntegerField(_('progress'), default=0)
+    error = models.TextField(_('error'), blank=True)
+    created_by = models.ForeignKey(User, verbose_name=_('created by'),
+        related_name='order_jobs_created', blank=True, null=True, editable=False)
+    created = models.DateTimeField(_('created'), auto_now_add=True)
+    started = models.DateTimeField(_('started'), blank=True, null=True)
+    finished = models.DateTimeField(_('finished'), blank=True, null=True)
+
+    class Meta:
+        ordering = ('created',)
+
+    def __unicode__(self):
+        return " ".join(["Order", str(self.order_id), self.status])
+
+    def dictify(self):
+        return {
+            "id": self.id,
+            "order": self.order_id,
+            "status": self.status,
+            "progress": self.progress,
+            "total": self.total,
+            "error": self.error,
+        }
+
+
 class Reciprocity(models.Model):
     """One Commitment reciprocating another.
 
@@ -1385,3 +1634,112 @@ class CachedEventSummary(models.Model):
 
     def value_formatted(self):
         return self.value.quantize(Decimal('.01'), rounding=ROUND_UP)
+
+
+def xbill_node_changed(sender, instance, **kwargs):
+    """
+    Updates the XbillClosure rows, and bumps the cached xbill version,
+    of every resource type whose extended bill contains ``instance``,
+    before or after the change.
+    """
+    if kwargs.get('raw'):
+        return
+    from valuenetwork.valueaccounting.utils import update_xbill_closure, bump_xbill_versions
+    bump_xbill_versions(update_xbill_closure(instance))
+
+for xbill_model in (ProcessTypeResourceType, AgentResourceType, Feature, Option):
+    models.signals.post_save.connect(xbill_node_changed, sender=xbill_model)
+    models.signals.post_delete.connect(xbill_node_changed, sender=xbill_model)
+
+def xbill_object_changed(sender, instance, **kwargs):
+    """
+    Bumps the cached xbill version of every resource type whose
+    extended bill shows ``instance``: names, photos and descriptions
+    are part of the cached tree, but not of the closure.
+    """
+    if kwargs.get('raw'):
+        return
+    from valuenetwork.valueaccounting.utils import xbill_ancestor_ids, bump_xbill_versions
+    bump_xbill_versions(xbill_ancestor_ids([instance]))
+
+for xbill_model in (EconomicResourceType, ProcessType, EconomicAgent):
+    models.signals.post_save.connect(xbill_object_changed, sender=xbill_model)
+
+def xbill_choices_changed(sender, instance, **kwargs):
+    from valuenetwork.valueaccounting.utils import clear_xbill_choices
+    clear_xbill_choices()
+
+for xbill_model in (EconomicResourceType, EconomicAgent):
+    models.signals.post_save.connect(xbill_choices_changed, sender=xbill_model)
+    models.signals.post_delete.connect(xbill_choices_changed, sender=xbill_model)
+
+def network_changed(sender, instance, **kwargs):
+    if kwargs.get('raw'):
+        return
+    from valuenetwork.valueaccounting.utils import bump_network_version
+    bump_network_version()
+
+for network_model in (ProcessTypeResourceType, AgentResourceType,
+        EconomicResourceType, ProcessType, EconomicAgent):
+    models.signals.post_save.connect(network_changed, sender=network_model)
+    models.signals.post_delete.connect(network_changed, sender=network_model)
+
+def order_changed(sender, instance, **kwargs):
+    if kwargs.get('raw'):
+        return
+    from valuenetwork.valueaccounting.utils import update_timeline_entries
+    update_timeline_entries([instance.id])
+
+models.signals.post_save.connect(order_changed, sender=Order)
+
+def order_deleted(sender, instance, **kwargs):
+    from valuenetwork.valueaccounting.utils import touch_timeline
+    touch_timeline(instance.id)
+
+models.signals.post_delete.connect(order_deleted, sender=Order)
+
+def commitment_changed(sender, instance, **kwargs):
+    """
+    Updates the timeline of the orders ``instance`` belongs to,
+    before and after the change.
+    """
+    if kwargs.get('raw'):
+        return
+    from valuenetwork.valueaccounting.utils import update_timeline_entries, timeline_node_id
+    order_ids = set([instance.order_id, instance.independent_demand_id])
+    order_ids.update(TimelineEntry.objects.filter(
+        node_id=timeline_node_id(instance)).values_list('order', flat=True))
+    update_timeline_entries(order_ids)
+
+models.signals.post_save.connect(commitment_changed, sender=Commitment)
+models.signals.post_delete.connect(commitment_changed, sender=Commitment)
+
+def process_changed(sender, instance, **kwargs):
+    """
+    Updates the timeline of the orders showing ``instance``: its
+    commitments' orders, and those it was on before the change
+    (deleting a process deletes its commitments first).
+    """
+    if kwargs.get('raw'):
+        return
+    from valuenetwork.valueaccounting.utils import update_timeline_entries, timeline_node_id
+    order_ids = set(TimelineEntry.objects.filter(
+        node_id=timeline_node_id(instance)).values_list('order', flat=True))
+    for order_id, demand_id in Commitment.objects.filter(
+            process=instance).values_list('order', 'independent_demand'):
+        order_ids.update([order_id, demand_id])
+    update_timeline_entries(order_ids)
+
+models.signals.post_save.connect(process_changed, sender=Process)
+models.signals.post_delete.connect(process_changed, sender=Process)
+
+def resource_type_deleting(sender, instance, **kwargs):
+    from valuenetwork.valueaccounting.utils import deleting_resource_type_ids
+    deleting_resource_type_ids().add(instance.id)
+
+def resource_type_deleted(sender, instance, **kwargs):
+    from valuenetwork.valueaccounting.utils import deleting_resource_type_ids
+    deleting_resource_type_ids().discard(instance.id)
+
+models.signals.pre_delete.connect(resource_type_deleting, sender=EconomicResourceType)
+models.signals.post_delete.connect(resource_type_deleted, sender=EconomicResourceType)
@@ -1,11 +1,19 @@
 import datetime
+import re
 from decimal import *
 
 from django.test import TestCase
 from django.test import Client
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import F
+from django.core.urlresolvers import reverse
+from django.utils import simplejson
 
 from valuenetwork.valueaccounting.models import *
+from valuenetwork.valueaccounting.utils import *
+from valuenetwork.valueaccounting.views import defer_choices
 
 class CompensationTest(TestCase):
 
@@ -184,3 +192,1026 @@ class CompensationTest(TestCase):
 
 
 
+class XbillTest(TestCase):
+
+    def setUp(self):
+
+        self.unit = Unit(
+            unit_type="quantity",
+            abbrev="Pc",
+            name="Pieces",
+        )
+        self.unit.save()
+
+        self.a_type = AgentType(
+            name="T",
+        )
+        self.a_type.save()
+
+        self.supplier = EconomicAgent(
+            name="Supplier",
+            nick="Supplier",
+            agent_type=self.a_type,
+            created_date=datetime.date.today(),
+        )
+        self.supplier.save()
+
+        self.produces = ResourceRelationship(
+            name="produces",
+            inverse_name="produced by",
+            direction="out",
+        )
+        self.produces.save()
+
+        self.consumes = ResourceRelationship(
+            name="consumes",
+            inverse_name="consumed by",
+            direction="in",
+        )
+        self.consumes.save()
+
+        self.supplies = ResourceRelationship(
+            name="supplies",
+            inverse_name="supplied by",
+            direction="out",
+        )
+        self.supplies.save()
+
+        self.product = self.resource_type("Product")
+        self.part_a = self.resource_type("Part A")
+        self.part_b = self.resource_type("Part B")
+        self.screw = self.resource_type("Screw")
+        self.red = self.resource_type("Red")
+        self.blue = self.resource_type("Blue")
+
+        self.make_product = self.process_type("Make Product", self.product)
+        self.make_a = self.process_type("Make Part A", self.part_a)
+        self.make_b = self.process_type("Make Part B", self.part_b)
+
+        self.input(self.make_product, self.part_a, "1")
+        self.input(self.make_product, self.part_b, "2")
+        self.input(self.make_a, self.screw, "4")
+        self.input(self.make_b, self.screw, "3")
+
+        art = AgentResourceType(
+            agent=self.supplier,
+            resource_type=self.screw,
+            relationship=self.supplies,
+        )
+        art.save()
+
+        self.color = Feature(
+            name="Color",
+            product=self.product,
+            process_type=self.make_product,
+            relationship=self.consumes,
+            quantity=Decimal("1"),
+        )
+        self.color.save()
+        for component in (self.red, self.blue):
+            option = Option(
+                feature=self.color,
+                component=component,
+            )
+            option.save()
+
+    def resource_type(self, name):
+        rt = EconomicResourceType(
+            name=name,
+            unit=self.unit,
+        )
+        rt.save()
+        return rt
+
+    def process_type(self, name, output):
+        pt = ProcessType(
+            name=name,
+        )
+        pt.save()
+        ptrt = ProcessTypeResourceType(
+            process_type=pt,
+            resource_type=output,
+            relationship=self.produces,
+            quantity=Decimal("1"),
+        )
+        ptrt.save()
+        return pt
+
+    def input(self, process_type, resource_type, quantity):
+        ptrt = ProcessTypeResourceType(
+            process_type=process_type,
+            resource_type=resource_type,
+            relationship=self.consumes,
+            quantity=Decimal(quantity),
+        )
+        ptrt.save()
+        return ptrt
+
+    def outline(self, nodes):
+        return [(node.depth, unicode(node.xbill_object())) for node in nodes]
+
+    def test_generate_xbill(self):
+        nodes = generate_xbill(self.product)
+        self.assertEqual(self.outline(nodes), [
+            (1, u"Make Product"),
+            (2, u"Part A"),
+            (3, u"Make Part A"),
+            (4, u"Screw"),
+            (5, u"Supplier"),
+            (2, u"Part B"),
+            (3, u"Make Part B"),
+            (4, u"Screw"),
+            (5, u"Supplier"),
+            (2, u"Color Feature for Product"),
+            (3, u"Blue"),
+            (3, u"Red"),
+        ])
+        self.assertTrue(nodes[0].open)
+        self.assertEqual(len(nodes[-1].close), 3)
+
+    def test_generate_xbill_queries(self):
+        # one query per relationship kind per level, however wide the bill
+        self.assertNumQueries(13, generate_xbill, self.product)
+
+    def test_closure_xbill(self):
+        self.assertEqual(
+            self.outline(closure_xbill(self.product)),
+            self.outline(generate_xbill(self.product)))
+        screws = XbillClosure.objects.filter(
+            ancestor=self.product,
+            child_id=self.screw.node_id()).order_by('path')
+        self.assertEqual([row.quantity for row in screws], [Decimal("4"), Decimal("6")])
+
+    def test_closure_follows_changes(self):
+        glue = self.resource_type("Glue")
+        self.input(self.make_a, glue, "1")
+        outline = self.outline(closure_xbill(self.product))
+        self.assertTrue((4, u"Glue") in outline)
+        self.assertEqual(outline, self.outline(generate_xbill(self.product)))
+        part_b_id = self.part_b.id
+        self.part_b.delete()
+        outline = self.outline(closure_xbill(self.product))
+        self.assertFalse((2, u"Part B") in outline)
+        self.assertEqual(outline, self.outline(generate_xbill(self.product)))
+        self.assertFalse(XbillClosure.objects.filter(ancestor__id=part_b_id).exists())
+
+    def closure_snapshot(self):
+        return sorted(XbillClosure.objects.values_list(
+            "ancestor", "path", "node_id", "child_id", "depth", "quantity"))
+
+    def test_closure_incremental(self):
+        part_a_rows = dict(XbillClosure.objects.filter(ancestor=self.product,
+            path__startswith="0000.0000.0000").values_list("id", "path"))
+        self.assertTrue(part_a_rows)
+        screw_input = self.make_b.resource_types.get(resource_type=self.screw)
+        screw_input.quantity = Decimal("5")
+        screw_input.save()
+        incremental = self.closure_snapshot()
+        # Part A's subtree was left alone
+        self.assertEqual(XbillClosure.objects.filter(id__in=part_a_rows).count(), len(part_a_rows))
+        # and the result is what a full rebuild gives
+        for rt in EconomicResourceType.objects.all():
+            rebuild_xbill_closure(rt)
+        self.assertEqual(incremental, self.closure_snapshot())
+        # several changes in one go
+        with xbill_closure_deferred():
+            for name in ("Washer", "Nut"):
+                self.input(self.make_a, self.resource_type(name), "2")
+            self.color.options.get(component=self.blue).delete()
+            self.assertEqual(incremental, self.closure_snapshot())
+        incremental = self.closure_snapshot()
+        self.assertEqual(self.outline(closure_xbill(self.product)),
+            self.outline(generate_xbill(self.product)))
+        for rt in EconomicResourceType.objects.all():
+            rebuild_xbill_closure(rt)
+        self.assertEqual(incremental, self.closure_snapshot())
+
+    def test_closure_limits(self):
+        import valuenetwork.valueaccounting.utils as utils
+        max_depth = utils.XBILL_CLOSURE_MAX_DEPTH
+        utils.XBILL_CLOSURE_MAX_DEPTH = 3
+        try:
+            rebuild_xbill_closure(self.product)
+            self.assertFalse(XbillClosure.objects.filter(ancestor=self.product).exists())
+            self.assertTrue(XbillClosure.objects.filter(ancestor=self.part_b).exists())
+            # built without the closure
+            self.assertEqual(len(closure_xbill(self.product)), len(generate_xbill(self.product)))
+        finally:
+            utils.XBILL_CLOSURE_MAX_DEPTH = max_depth
+
+    def test_cached_xbill(self):
+        before = xbill_cache_stats()
+        first = cached_xbill(self.product)
+        second = cached_xbill(self.product)
+        self.assertEqual(self.outline(first), self.outline(second))
+        after = xbill_cache_stats()
+        self.assertEqual(after["misses"] - before["misses"], 1)
+        self.assertEqual(after["hits"] - before["hits"], 1)
+        part_b_version = xbill_version(self.part_b.id)
+        glue = self.resource_type("Glue")
+        self.input(self.make_a, glue, "1")
+        self.assertTrue((4, u"Glue") in self.outline(cached_xbill(self.product)))
+        self.assertEqual(xbill_cache_stats()["misses"] - after["misses"], 1)
+        self.assertEqual(xbill_version(self.part_b.id), part_b_version)
+        self.screw.name = "Bolt"
+        self.screw.save()
+        self.assertTrue((4, u"Bolt") in self.outline(cached_xbill(self.product)))
+
+    def test_cached_xbill_first_child(self):
+        glue = self.resource_type("Glue")
+        self.assertEqual(cached_xbill(glue), [])
+        AgentResourceType(agent=self.supplier, resource_type=glue,
+            relationship=self.supplies).save()
+        self.assertEqual(self.outline(cached_xbill(glue)), [(1, u"Supplier")])
+        make_glue = self.process_type("Make Glue", glue)
+        self.assertEqual(self.outline(cached_xbill(glue)), [(1, u"Make Glue"), (1, u"Supplier")])
+        make_glue.resource_types.all().delete()
+        AgentResourceType.objects.filter(resource_type=glue).delete()
+        self.assertEqual(cached_xbill(glue), [])
+        # without closure maintenance, the top still notices
+        with xbill_closure_suspended():
+            AgentResourceType(agent=self.supplier, resource_type=glue,
+                relationship=self.supplies).save()
+            self.assertEqual(self.outline(cached_xbill(glue)), [(1, u"Supplier")])
+            self.input(self.make_a, glue, "1")
+        self.assertFalse((4, u"Glue") in self.outline(cached_xbill(self.product)))
+        rebuild_xbill_closure(self.product)
+        self.assertTrue((4, u"Glue") in self.outline(cached_xbill(self.product)))
+
+    def test_generate_xbill_limits(self):
+        nodes = self.assertNumQueries(2, generate_xbill, self.product, 1)
+        nodes = generate_xbill(self.product, 2)
+        self.assertEqual(self.outline(nodes), [
+            (1, u"Make Product"),
+            (2, u"Part A"),
+            (2, u"Part B"),
+            (2, u"Color Feature for Product"),
+        ])
+        self.assertEqual(len(nodes[-1].close), 2)
+        nodes = generate_xbill(self.product, categories=["features"])
+        self.assertEqual(self.outline(nodes), [
+            (1, u"Make Product"),
+            (2, u"Color Feature for Product"),
+            (3, u"Blue"),
+            (3, u"Red"),
+        ])
+        self.assertEqual([node.show for node in nodes], [False, True, True, True])
+
+    def test_lazy_xbill(self):
+        nodes = lazy_xbill(self.product)
+        self.assertEqual(self.outline(nodes), [(1, u"Make Product")])
+        self.assertTrue(nodes[0].expandable)
+        nodes = xbill_expand(nodes[0].node.node_id(), 2)
+        self.assertEqual(self.outline(nodes), [
+            (2, u"Part A"),
+            (2, u"Part B"),
+            (2, u"Color Feature for Product"),
+        ])
+        self.assertEqual([node.expandable for node in nodes], [True, True, True])
+        options = xbill_expand(nodes[-1].node.node_id(), 3)
+        self.assertEqual(self.outline(options), [(3, u"Blue"), (3, u"Red")])
+        self.assertEqual([node.expandable for node in options], [False, False])
+        self.assertEqual(xbill_expand("Feature-0"), None)
+        self.assertEqual(xbill_expand("nonsense"), None)
+
+    def test_json_xbill_children(self):
+        response = self.client.get(reverse("json_xbill_children",
+            args=[self.product.node_id()]))
+        self.assertEqual(response.status_code, 200)
+        children = simplejson.loads(response.content)
+        self.assertEqual([child["name"] for child in children], [u"Make Product"])
+        self.assertEqual(children[0]["class"], "process-type")
+        self.assertTrue(children[0]["expandable"])
+        response = self.client.get(reverse("json_xbill_children",
+            args=["Option-0"]))
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(reverse("json_xbill_children",
+            args=[self.product.node_id()]), {"depth": "deep"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_shared_parts_expanded_once(self):
+        graph = XbillGraph(self.product)
+        below_screw = [node for node in graph.nodes
+            if node.xbill_parent_object().node_id() == self.screw.node_id()]
+        self.assertEqual(len(below_screw), 1)
+        # loaded once, but shown under both parts
+        self.assertEqual([unicode(node.xbill_object()) for node in
+            generate_xbill(self.product)].count(u"Supplier"), 2)
+
+    def test_shared_parts_supplied_once(self):
+        events = {"events": []}
+        explode_events(self.product, datetime.date(2013, 3, 1), events)
+        # the screw is supplied once, for both parts
+        self.assertEqual(len(events["events"]), 4)
+
+    def test_backschedule_graph(self):
+        for pt, days in ((self.make_product, 1), (self.make_a, 2), (self.make_b, 5)):
+            pt.estimated_duration = days * 1440
+            pt.save()
+        AgentResourceType.objects.filter(resource_type=self.screw).update(lead_time=3)
+        # suppliers, producers and inputs per level; the screw has no producers
+        with self.assertNumQueries(8):
+            graph = BackscheduleGraph([self.product])
+        events = graph.timeline_events({self.product.id: datetime.date(2013, 3, 10)})
+        dates = dict((unicode(event.node), (event.start, event.end)) for event in events)
+        self.assertEqual(dates[u"Make Product"], (datetime.date(2013, 3, 9), datetime.date(2013, 3, 10)))
+        self.assertEqual(dates[u"Make Part A"], (datetime.date(2013, 3, 7), datetime.date(2013, 3, 9)))
+        self.assertEqual(dates[u"Make Part B"], (datetime.date(2013, 3, 4), datetime.date(2013, 3, 9)))
+        # in time for the earlier of the two process types using it
+        screw = [event for event in events if isinstance(event.node, AgentResourceType)]
+        self.assertEqual(len(screw), 1)
+        self.assertEqual(screw[0].start, datetime.date(2013, 3, 1))
+        # parents before children
+        names = [unicode(event.node) for event in events]
+        self.assertTrue(names.index(u"Make Product") < names.index(u"Make Part B"))
+
+    def test_xbill_cycle(self):
+        make_screw = self.process_type("Make Screw", self.screw)
+        self.input(make_screw, self.part_a, "1")
+        self.assertRaises(XbillCycleError, generate_xbill, self.product)
+        self.assertRaises(XbillCycleError, closure_xbill, self.product)
+        nodes, edges = graphify(self.product, 10)
+        self.assertTrue(self.part_a in nodes)
+        self.assertRaises(XbillCycleError, explode_events, self.product, datetime.date.today(), {"events": []})
+        try:
+            generate_xbill(self.part_a)
+        except XbillCycleError, e:
+            self.assertEqual([unicode(obj) for obj in e.cycle],
+                [u"Part A", u"Make Part A", u"Screw", u"Make Screw", u"Part A"])
+        response = self.client.get(reverse("extended_bill", args=[self.product.id]))
+        self.assertContains(response, "Recipe cycle")
+
+    def test_where_used(self):
+        with self.assertNumQueries(1):
+            used_in = list(xbill_where_used(self.screw))
+        self.assertEqual(
+            [(rt.name, rt.where_used_depth, rt.where_used_quantity) for rt in used_in],
+            [(u"Part A", 2, Decimal("4")), (u"Part B", 2, Decimal("3")), (u"Product", 4, Decimal("10"))])
+        self.assertEqual([rt.name for rt in xbill_where_used(self.red)], [u"Product"])
+        self.assertEqual(list(xbill_where_used(self.product)), [])
+        response = self.client.get(reverse("json_where_used", args=[self.screw.id]))
+        self.assertEqual([rt["name"] for rt in simplejson.loads(response.content)],
+            [u"Part A", u"Part B", u"Product"])
+
+    def test_delete_confirmation_shows_where_used(self):
+        User.objects.create_user("alice", "alice@example.com", "password")
+        self.client.login(username="alice", password="password")
+        response = self.client.get(reverse("delete_resource_type_confirmation",
+            args=[self.red.id]))
+        self.assertContains(response, "option for the Feature")
+        self.assertEqual([rt.name for rt in response.context["used_in"]], [u"Product"])
+        self.assertTrue(EconomicResourceType.objects.filter(id=self.red.id).exists())
+
+    def test_flattened_requirements(self):
+        self.assertEqual(
+            [(rt.name, qty) for rt, qty in flattened_requirements(self.product)],
+            [(u"Screw", Decimal("10"))])
+        red = self.color.options.get(component=self.red)
+        self.assertEqual(
+            [(rt.name, qty) for rt, qty in flattened_requirements(self.product, [red.id])],
+            [(u"Red", Decimal("1")), (u"Screw", Decimal("10"))])
+        response = self.client.get(reverse("json_flattened_bill", args=[self.product.id]),
+            {"quantity": "3", "options": str(red.id)})
+        self.assertEqual(simplejson.loads(response.content), [
+            {"id": self.red.id, "name": u"Red", "quantity": "3", "unit": u"Pc"},
+            {"id": self.screw.id, "name": u"Screw", "quantity": "30", "unit": u"Pc"},
+        ])
+        response = self.client.get(reverse("flattened_bill_csv", args=[self.product.id]))
+        self.assertEqual(response.content.splitlines(),
+            ["id,name,quantity,unit", "%s,Screw,10,Pc" % self.screw.id])
+        response = self.client.get(reverse("json_flattened_bill", args=[self.product.id]),
+            {"quantity": "lots"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_flattened_bill_without_unit(self):
+        self.screw.unit = None
+        self.screw.save()
+        response = self.client.get(reverse("json_flattened_bill", args=[self.product.id]))
+        self.assertEqual(simplejson.loads(response.content), [
+            {"id": self.screw.id, "name": u"Screw", "quantity": "10", "unit": u""},
+        ])
+        response = self.client.get(reverse("flattened_bill_csv", args=[self.product.id]))
+        self.assertEqual(response.content.splitlines(),
+            ["id,name,quantity,unit", "%s,Screw,10," % self.screw.id])
+
+    def test_xbill_cost(self):
+        self.screw.rate = Decimal("0.10")
+        self.screw.save()
+        self.red.rate = Decimal("2.00")
+        self.red.save()
+        self.blue.rate = Decimal("3.00")
+        self.blue.save()
+        # 10 screws and the cheaper color
+        self.assertEqual(self.product.rolled_up_cost(), Decimal("3.00"))
+        self.assertEqual(xbill_cost(self.part_b), Decimal("0.30"))
+        art = self.screw.agents.get()
+        art.value = Decimal("0.05")
+        art.save()
+        self.assertEqual(xbill_cost(self.product), Decimal("2.50"))
+        # only what uses the screw is recomputed: red costs just its version
+        self.assertNumQueries(1, xbill_cost, self.red)
+        self.red.rate = Decimal("4.00")
+        self.red.save()
+        # the parts are still cached, so nothing below them is loaded
+        with self.assertNumQueries(10):
+            self.assertEqual(xbill_cost(self.product), Decimal("3.50"))
+        response = self.client.get(reverse("json_resource_type_cost", args=[self.product.id]))
+        self.assertEqual(simplejson.loads(response.content)["cost"], "3.50")
+
+    def test_lazy_xbill_forms(self):
+        User.objects.create_user("alice", "alice@example.com", "password")
+        self.client.login(username="alice", password="password")
+        response = self.client.get(reverse("edit_extended_bill", args=[self.product.id]))
+        self.assertContains(response, reverse("xbill_form", args=["change-feature", self.color.id]))
+        self.assertNotContains(response, "Supplier</option>")
+        art = self.screw.agents.get()
+        response = self.client.get(reverse("xbill_form", args=["change-source", art.id]))
+        self.assertContains(response, 'data-choices="agents"')
+        self.assertContains(response, "Supplier</option>", 1)
+        response = self.client.get(reverse("xbill_form", args=["nonsense", art.id]))
+        self.assertEqual(response.status_code, 404)
+        form = art.xbill_change_form()
+        defer_choices(form)
+        self.assertEqual(list(form.fields["agent"].widget.choices), [(self.supplier.id, u"Supplier")])
+        form.fields["agent"].required = False
+        defer_choices(form)
+        self.assertEqual([choice[0] for choice in form.fields["agent"].widget.choices],
+            ["", self.supplier.id])
+
+    def test_xbill_choices(self):
+        response = self.client.get(reverse("json_xbill_choices"))
+        choices = simplejson.loads(response.content)
+        self.assertEqual(choices["agents"], [[self.supplier.id, u"Supplier"]])
+        self.assertEqual(len(choices["resource_types"]), 6)
+        # just the version
+        self.assertNumQueries(1, xbill_choices)
+        self.resource_type("Nut")
+        self.assertEqual(len(xbill_choices()["resource_types"]), 7)
+        # a bump from another process reaches this one's cache through the database
+        EconomicResourceType.objects.bulk_create([EconomicResourceType(name="Bolt", unit=self.unit)])
+        self.assertEqual(len(xbill_choices()["resource_types"]), 7)
+        CacheVersion.objects.filter(name="xbill-choices").update(version=F("version") + 1)
+        self.assertEqual(len(xbill_choices()["resource_types"]), 8)
+
+    def test_graphify(self):
+        # a second screw input to Make Part B, drawn as a wider edge
+        self.input(self.make_b, self.screw, "1")
+        # one query per relationship kind per level
+        with self.assertNumQueries(8):
+            nodes, edges = graphify(self.product, 3)
+        self.assertEqual([unicode(node) for node in nodes], [
+            u"Product", u"Make Product", u"Part A", u"Part B",
+            u"Make Part A", u"Make Part B", u"Screw", u"Supplier",
+        ])
+        widths = dict(((unicode(edge.from_node), unicode(edge.to_node)), edge.width) for edge in edges)
+        self.assertEqual(widths[(u"Screw", u"Make Part B")], 2)
+        self.assertEqual(widths[(u"Screw", u"Make Part A")], 1)
+        self.assertEqual(len(edges), 8)
+
+    def test_network_layout(self):
+        nodes, edges = graphify(self.product, 3)
+        layout = cached_network_layout(self.product, 3, nodes, edges)
+        self.assertEqual(sorted(layout), sorted(node.node_id() for node in nodes))
+        for x, y in layout.values():
+            self.assertTrue(0 <= x <= 1 and 0 <= y <= 1)
+        # laid out nodes are spread apart
+        self.assertEqual(len(set(layout.values())), len(nodes))
+        self.assertEqual(cached_network_layout(self.product, 3, nodes, edges), layout)
+        # big graphs get fewer iterations
+        self.assertEqual(layout_iterations(len(nodes)), NETWORK_LAYOUT_ITERATIONS)
+        self.assertEqual(layout_iterations(100000), NETWORK_LAYOUT_MIN_ITERATIONS)
+        # after a change, the new layout carries on from the last one
+        self.input(self.make_a, self.resource_type("Glue"), "1")
+        nodes, edges = graphify(self.product, 3)
+        settled = cached_network_layout(self.product, 3, nodes, edges)
+        self.assertEqual(len(settled), len(layout) + 1)
+        fresh = spring_layout(nodes, edges, seed=self.product.id)
+        def moved(other):
+            return sum(abs(other[node_id][0] - x) + abs(other[node_id][1] - y)
+                for node_id, (x, y) in layout.items())
+        self.assertTrue(moved(settled) < moved(fresh))
+        response = self.client.get(reverse("network", args=[self.product.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "layoutPosX")
+
+    def test_agent_network(self):
+        customer = EconomicAgent(
+            name="Customer",
+            nick="Customer",
+            agent_type=self.a_type,
+            created_date=datetime.date.today(),
+        )
+        customer.save()
+        AgentResourceType(
+            agent=customer,
+            resource_type=self.screw,
+            relationship=self.consumes,
+        ).save()
+        # one hop: the screw, the process types using it and its other agents
+        with self.assertNumQueries(3):
+            nodes, edges = agent_network(self.supplier, 1)
+        self.assertEqual(set(unicode(node) for node in nodes), set([
+            u"Supplier", u"Screw", u"Make Part A", u"Make Part B", u"Customer"]))
+        labels = dict(((unicode(edge.from_node), unicode(edge.to_node)), edge.label) for edge in edges)
+        self.assertEqual(labels[(u"Supplier", u"Screw")], u"supplies")
+        self.assertEqual(labels[(u"Screw", u"Customer")], u"consumes")
+        self.assertEqual(labels[(u"Screw", u"Make Part A")], u"consumed by")
+        nodes, edges = cached_agent_network(self.supplier, 1)
+        # just the network version
+        with self.assertNumQueries(1):
+            self.assertEqual(len(cached_agent_network(self.supplier, 1)[0]), len(nodes))
+        AgentResourceType(
+            agent=self.supplier,
+            resource_type=self.part_b,
+            relationship=self.supplies,
+        ).save()
+        # Part B, and Make Product consuming it
+        self.assertEqual(len(cached_agent_network(self.supplier, 1)[0]), len(nodes) + 2)
+        response = self.client.get(reverse("agent_network", args=[customer.id]), {"hops": "9"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["hops"], 4)
+        self.assertContains(response, self.supplier.node_id())
+
+    def test_agent_network_many_agents(self):
+        for batch in chunks(range(1200)):
+            EconomicAgent.objects.bulk_create([EconomicAgent(name="Agent %s" % i,
+                nick="Agent %s" % i, agent_type=self.a_type,
+                created_date=datetime.date.today()) for i in batch])
+        for batch in chunks(EconomicAgent.objects.exclude(id=self.supplier.id)):
+            AgentResourceType.objects.bulk_create([AgentResourceType(agent=agent,
+                resource_type=self.screw, relationship=self.consumes)
+                for agent in batch])
+        # a second hop, from one of them to Part B and its other agents
+        AgentResourceType(agent=EconomicAgent.objects.get(name="Agent 0"),
+            resource_type=self.part_b, relationship=self.supplies).save()
+        connection.use_debug_cursor = True
+        connection.queries = []
+        try:
+            nodes, edges = agent_network(self.supplier, 2)
+        finally:
+            connection.use_debug_cursor = None
+        self.assertEqual(len([node for node in nodes if isinstance(node, EconomicAgent)]),
+            EconomicAgent.objects.count())
+        # no lookup lists all the agents seen, more than sqlite may take
+        for query in connection.queries:
+            for ids in re.findall(r"IN \(([^)]*)\)", query["sql"]):
+                self.assertTrue(ids.count(",") < 500)
+
+    def test_agent_network_without_relationships(self):
+        ProcessTypeResourceType(process_type=self.make_a, resource_type=self.screw,
+            quantity=Decimal("1")).save()
+        AgentResourceType(agent=self.supplier, resource_type=self.red).save()
+        nodes, edges = agent_network(self.supplier, 1)
+        labels = dict(((unicode(edge.from_node), unicode(edge.to_node)), edge.label) for edge in edges)
+        self.assertEqual(labels[(u"Red", u"Supplier")], "")
+        response = self.client.get(reverse("agent_network", args=[self.supplier.id]))
+        self.assertEqual(response.status_code, 200)
+
+    def test_network_metrics(self):
+        counts = refresh_network_metrics(processes=2)
+        self.assertEqual(counts["created"], NetworkMetric.objects.count())
+        metrics = dict((metric.node_id, metric) for metric in NetworkMetric.objects.all())
+        screw = metrics[self.screw.node_id()]
+        self.assertEqual(screw.degree, 3)
+        # from Supplier to both process types, parts and the product
+        self.assertEqual(screw.betweenness, 6.0)
+        self.assertEqual(screw.blocked_products, 1)
+        self.assertEqual(metrics[self.supplier.node_id()].blocked_products, 1)
+        self.assertEqual(metrics[self.red.node_id()].blocked_products, 0)
+        self.assertEqual(refresh_network_metrics(processes=1), None)
+        # the version is in the database, so other processes see it too
+        cache.clear()
+        self.assertEqual(refresh_network_metrics(processes=1), None)
+        # a second supplier: losing either one no longer blocks anything
+        backup = EconomicAgent(
+            name="Backup",
+            nick="Backup",
+            agent_type=self.a_type,
+            created_date=datetime.date.today(),
+        )
+        backup.save()
+        AgentResourceType(
+            agent=backup,
+            resource_type=self.screw,
+            relationship=self.supplies,
+        ).save()
+        counts = refresh_network_metrics(processes=1)
+        self.assertEqual(counts["created"], 1)
+        self.assertEqual(NetworkMetric.objects.get(node_id=self.supplier.node_id()).blocked_products, 0)
+        self.assertEqual(NetworkMetric.objects.get(node_id=self.screw.node_id()).blocked_products, 1)
+        response = self.client.get(reverse("network_metrics"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["metrics"][0].blocked_products, 1)
+
+    def test_json_timeline(self):
+        customer = EconomicAgent(
+            name="Customer",
+            nick="Customer",
+            agent_type=self.a_type,
+            created_date=datetime.date.today(),
+        )
+        customer.save()
+        orders = []
+        for due, provider in ((datetime.date(2012, 1, 10), self.supplier),
+                (datetime.date(2012, 2, 10), self.supplier),
+                (datetime.date(2012, 3, 10), customer)):
+            order = Order(provider=provider, receiver=customer, due_date=due)
+            order.save()
+            orders.append(order)
+        # the second order's work starts inside January
+        process = Process(name="Make Part A", process_type=self.make_a,
+            start_date=datetime.date(2012, 1, 5), end_date=datetime.date(2012, 2, 10))
+        process.save()
+        e_type = EventType(name="Production", resource_effect="+", unit_type="quantity")
+        e_type.save()
+        commitment = Commitment(
+            order=orders[1],
+            independent_demand=orders[1],
+            event_type=e_type,
+            relationship=self.produces,
+            due_date=datetime.date(2012, 2, 10),
+            resource_type=self.part_a,
+            process=process,
+            quantity=Decimal("1"),
+        )
+        commitment.save()
+        self.assertEqual([entry.kind for entry in orders[1].timeline_entries.order_by("position")],
+            [u"Order", u"Commitment", u"Process"])
+
+        def timeline(**params):
+            response = self.client.get(reverse("json_timeline"), params)
+            self.assertEqual(response.status_code, 200)
+            data = simplejson.loads(response.content)
+            return sorted(set(event["order"] for event in data["events"])), data["next"]
+
+        # the last change stamp, the end of the page, and the events
+        with self.assertNumQueries(3):
+            self.assertEqual(timeline(start="2012-01-01", end="2012-01-31"),
+                ([orders[0].id, orders[1].id], None))
+        self.assertEqual(timeline(start="2012-02-01"), ([orders[1].id, orders[2].id], None))
+        self.assertEqual(timeline(agent=self.supplier.id), ([orders[0].id, orders[1].id], None))
+        self.assertEqual(timeline(order=orders[2].id), ([orders[2].id], None))
+        event_ids = []
+        cursor = ""
+        while cursor is not None:
+            response = self.client.get(reverse("json_timeline"), {"limit": 2, "cursor": cursor})
+            data = simplejson.loads(response.content)
+            event_ids.extend(event["id"] for event in data["events"])
+            cursor = data["next"]
+        self.assertEqual(sorted(event_ids), sorted(TimelineEntry.objects.values_list("id", flat=True)))
+        self.assertEqual(len(event_ids), 5)
+        response = self.client.get(reverse("json_timeline"))
+        events = simplejson.loads(response.content)["events"]
+        self.assertEqual([event["id"] for event in events],
+            list(TimelineEntry.objects.values_list("id", flat=True)))
+        entry = orders[0].timeline_entries.get()
+        self.assertEqual([event for event in events if event["id"] == entry.id][0], {"id": entry.id, "order": orders[0].id,
+            "start": "Jan 10 2012 00:00:00 GMT-0600", "title": entry.title,
+            "description": entry.description, "durationEvent": False})
+        self.assertEqual(simplejson.loads(timeline_event_json((entry.id, orders[0].id,
+            datetime.date(2012, 1, 10), datetime.date(2012, 1, 12), u"T\xeftle", "/o/", ""))), {
+            "id": entry.id, "order": orders[0].id, "start": "Jan 10 2012 00:00:00 GMT-0600",
+            "end": "Jan 12 2012 00:00:00 GMT-0600", "durationEvent": True,
+            "title": u"T\xeftle", "link": "/o/", "description": ""})
+        parts = list(stream_timeline_json(
+            TimelineEntry.objects.values_list(*TIMELINE_ROW_FIELDS), batch_size=2, next=None))
+        self.assertEqual(len(simplejson.loads("".join(parts))["events"]), 5)
+        # the head, three batches of events, and the tail
+        self.assertEqual(len(parts), 7)
+        response = self.client.get(reverse("json_timeline"), {"cursor": "yesterday"})
+        self.assertEqual(response.status_code, 400)
+
+        # the table follows process and commitment changes
+        process.start_date = datetime.date(2011, 12, 20)
+        process.save()
+        self.assertEqual(TimelineEntry.objects.get(node_id="Process-%s" % process.id).start,
+            datetime.date(2011, 12, 20))
+        commitment.delete()
+        self.assertEqual([entry.kind for entry in orders[1].timeline_entries.all()], [u"Order"])
+        with timeline_deferred():
+            orders[0].due_date = datetime.date(2012, 1, 11)
+            orders[0].save()
+            self.assertEqual(orders[0].timeline_entries.get().start, datetime.date(2012, 1, 10))
+        self.assertEqual(orders[0].timeline_entries.get().start, datetime.date(2012, 1, 11))
+
+    def test_json_timeline_since(self):
+        customer = EconomicAgent(
+            name="Customer",
+            nick="Customer",
+            agent_type=self.a_type,
+            created_date=datetime.date.today(),
+        )
+        customer.save()
+        orders = []
+        for day in (10, 20):
+            order = Order(provider=self.supplier, receiver=customer,
+                due_date=datetime.date(2012, 1, day))
+            order.save()
+            orders.append(order)
+        response = self.client.get(reverse("json_timeline"))
+        data = simplejson.loads(response.content)
+        self.assertEqual(len(data["events"]), 2)
+        etag = response["ETag"]
+        self.assertTrue(response.has_header("Last-Modified"))
+        response = self.client.get(reverse("json_timeline"), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(reverse("json_timeline"), {"since": data["stamp"]})
+        self.assertEqual(simplejson.loads(response.content)["events"], [])
+
+        orders[1].due_date = datetime.date(2012, 1, 21)
+        orders[1].save()
+        order_ids = [order.id for order in orders]
+        orders[0].delete()
+        response = self.client.get(reverse("json_timeline"), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(reverse("json_timeline"), {"since": data["stamp"]})
+        changes = simplejson.loads(response.content)
+        self.assertEqual([event["order"] for event in changes["events"]], [orders[1].id])
+        self.assertEqual(sorted(changes["changed_orders"]), order_ids)
+        self.assertTrue(changes["stamp"] > data["stamp"])
+        response = self.client.get(reverse("json_timeline"), {"since": "now"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_capacity_schedule(self):
+        labor = self.resource_type("Labor")
+        labor.materiality = "work"
+        labor.save()
+        AgentResourceType(
+            agent=self.supplier,
+            resource_type=labor,
+            capacity=Decimal("8"),
+        ).save()
+        e_type = EventType(name="Production", resource_effect="+", unit_type="quantity")
+        e_type.save()
+        order = Order(provider=self.supplier, receiver=self.supplier,
+            due_date=datetime.date(2013, 3, 31))
+        order.save()
+
+        def process(pt, output, inputs):
+            pt.estimated_duration = 1440
+            pt.save()
+            process = Process(name=pt.name, process_type=pt, start_date=order.due_date)
+            process.save()
+            for rt, relationship, quantity, agent in [(output, self.produces, "1", None)] + inputs:
+                Commitment(
+                    # the product is what the order is for
+                    order=order if rt == self.product else None,
+                    independent_demand=order,
+                    event_type=e_type,
+                    relationship=relationship,
+                    due_date=order.due_date,
+                    resource_type=rt,
+                    process=process,
+                    from_agent=agent,
+                    quantity=Decimal(quantity),
+                ).save()
+            return process
+
+        make_a = process(self.make_a, self.part_a, [(labor, self.consumes, "8", self.supplier)])
+        # unassigned, so it waits for any capable agent
+        make_b = process(self.make_b, self.part_b, [(labor, self.consumes, "8", None)])
+        make_product = process(self.make_product, self.product, [
+            (self.part_a, self.consumes, "1", None),
+            (self.part_b, self.consumes, "1", None),
+            (labor, self.consumes, "20", self.supplier),
+        ])
+        schedule = CapacitySchedule(Order.objects.all(), datetime.date(2013, 3, 1))
+        self.assertEqual(schedule.backward()[make_product.id], datetime.date(2013, 3, 30))
+        placed = schedule.forward()
+        self.assertEqual(placed[make_a.id], (datetime.date(2013, 3, 1), datetime.date(2013, 3, 2)))
+        self.assertEqual(placed[make_b.id], (datetime.date(2013, 3, 2), datetime.date(2013, 3, 3)))
+        # after both parts, and 20 hours take three of the supplier's days
+        self.assertEqual(placed[make_product.id], (datetime.date(2013, 3, 3), datetime.date(2013, 3, 6)))
+        self.assertEqual(schedule.late(), [])
+        schedule.save()
+        make_b = Process.objects.get(id=make_b.id)
+        self.assertEqual((make_b.start_date, make_b.end_date),
+            (datetime.date(2013, 3, 2), datetime.date(2013, 3, 3)))
+        self.assertEqual(set(make_b.incoming_commitments().values_list("due_date", flat=True)),
+            set([datetime.date(2013, 3, 2)]))
+        self.assertEqual(make_b.main_outgoing_commitment().due_date, datetime.date(2013, 3, 3))
+        # the timeline follows, though updates send no signals
+        self.assertEqual(TimelineEntry.objects.get(node_id="Process-%s" % make_product.id).start,
+            datetime.date(2013, 3, 3))
+
+    def test_critical_path(self):
+        e_type = EventType(name="Production", resource_effect="+", unit_type="quantity")
+        e_type.save()
+        order = Order(provider=self.supplier, receiver=self.supplier,
+            due_date=datetime.date(2013, 3, 10))
+        order.save()
+
+        def process(pt, days, output, inputs):
+            start = datetime.date(2013, 3, 1)
+            process = Process(name=pt.name, process_type=pt, start_date=start,
+                end_date=start + datetime.timedelta(days=days))
+            process.save()
+            for rt, relationship in [(output, self.produces)] + inputs:
+                Commitment(
+                    order=order if rt == self.product else None,
+                    independent_demand=order,
+                    event_type=e_type,
+                    relationship=relationship,
+                    due_date=order.due_date,
+                    resource_type=rt,
+                    process=process,
+                    quantity=Decimal("1"),
+                ).save()
+            return process
+
+        make_a = process(self.make_a, 2, self.part_a, [])
+        make_b = process(self.make_b, 4, self.part_b, [])
+        make_product = process(self.make_product, 3, self.product,
+            [(self.part_a, self.consumes), (self.part_b, self.consumes)])
+        with self.assertNumQueries(1):
+            path = CriticalPath(order)
+        rows = dict((row["process"].id, row) for row in path.rows)
+        self.assertEqual(rows[make_b.id]["early_finish"], datetime.date(2013, 3, 5))
+        self.assertEqual(rows[make_product.id]["early_start"], datetime.date(2013, 3, 5))
+        self.assertEqual(path.finish, datetime.date(2013, 3, 8))
+        self.assertEqual(rows[make_product.id]["late_start"], datetime.date(2013, 3, 7))
+        self.assertEqual([rows[p.id]["slack"] for p in (make_a, make_b, make_product)], [4, 2, 2])
+        self.assertEqual([p.id for p in path.chain], [make_b.id, make_product.id])
+        self.assertFalse(rows[make_a.id]["critical"])
+        response = self.client.get(reverse("json_critical_path", args=[order.id]))
+        data = simplejson.loads(response.content)
+        self.assertEqual(data["driving_chain"], [make_b.id, make_product.id])
+        self.assertEqual(data["finish"], "2013-03-08")
+        response = self.client.get(reverse("order_schedule", args=[order.id]))
+        self.assertContains(response, "Critical Path")
+
+        # every process on a cycle: nothing can be ordered
+        order = Order(provider=self.supplier, receiver=self.supplier,
+            due_date=datetime.date(2013, 3, 10))
+        order.save()
+        process(self.make_a, 2, self.part_a, [(self.part_b, self.consumes)])
+        process(self.make_b, 4, self.part_b, [(self.part_a, self.consumes)])
+        path = CriticalPath(order)
+        self.assertEqual((path.rows, path.chain), ([], []))
+        response = self.client.get(reverse("json_critical_path", args=[order.id]))
+        self.assertEqual(simplejson.loads(response.content)["finish"], None)
+
+    def test_order_plan(self):
+        e_type = EventType(name="Production", resource_effect="+", unit_type="quantity")
+        e_type.save()
+        self.produces.event_type = e_type
+        self.produces.save()
+        self.consumes.event_type = EventType.objects.create(name="Consumption",
+            resource_effect="-", unit_type="quantity")
+        self.consumes.save()
+        for pt in (self.make_product, self.make_a, self.make_b):
+            pt.estimated_duration = 1440
+            pt.save()
+        due = datetime.date(2013, 3, 31)
+        start = datetime.date(2013, 3, 30)
+        Process(name="Make Product", process_type=self.make_product, start_date=start).save()
+        order = Order(provider=self.supplier, receiver=self.supplier, due_date=due)
+        order.save()
+        plan = OrderPlan(order)
+
+        def line(quantity):
+            process = plan.add_process(self.make_product, start, due)
+            plan.add_commitment(order=order, event_type=e_type, relationship=self.produces,
+                due_date=due, resource_type=self.product, process=process,
+                quantity=Decimal(quantity))
+            plan.explode(process, Decimal(quantity))
+            return process
+
+        line("5")
+        # the recipe is cached after the first line
+        with self.assertNumQueries(0):
+            line("1")
+        self.assertEqual(len(plan.processes), 6)
+        plan.save()
+        processes = Process.objects.filter(commitments__independent_demand=order).distinct()
+        self.assertEqual(processes.count(), 6)
+        # the commitments hang on the plan's own processes, by their real ids
+        self.assertEqual(set(processes.values_list("id", flat=True)),
+            set(process.id for process in plan.processes))
+        self.assertEqual(set(commitment.process_id for commitment in plan.commitments),
+            set(process.id for process in plan.processes))
+        self.assertEqual(sorted(processes.filter(process_type=self.make_product).values_list("slug", flat=True)),
+            ["make-product-make-product-2013-03-30-2", "make-product-make-product-2013-03-30-3"])
+        make_a = processes.filter(process_type=self.make_a, end_date=start)
+        self.assertEqual(sorted(c.quantity for c in Commitment.objects.filter(
+            process__in=make_a, resource_type=self.screw)), [Decimal("4"), Decimal("20")])
+        commitments = Commitment.objects.filter(independent_demand=order)
+        self.assertEqual(commitments.count(), len(set(commitments.values_list("slug", flat=True))))
+        self.assertTrue(TimelineEntry.objects.filter(order=order,
+            node_id="Process-%s" % make_a[0].id).exists())
+
+    def test_order_job(self):
+        self.produces.event_type = EventType.objects.create(name="Production",
+            resource_effect="+", unit_type="quantity")
+        self.produces.save()
+        self.consumes.event_type = EventType.objects.create(name="Consumption",
+            resource_effect="-", unit_type="quantity")
+        self.consumes.save()
+        order = Order(provider=self.supplier, receiver=self.supplier,
+            due_date=datetime.date(2013, 3, 31))
+        order.save()
+        red = Option.objects.get(component=self.red)
+        job = queue_order_explosion(order, [{"resource_type": self.product.id,
+            "quantity": "2", "description": "", "options": [red.id]}])
+        response = self.client.get(reverse("json_order_job", args=[order.id]))
+        self.assertEqual(simplejson.loads(response.content)["status"], "pending")
+        self.assertEqual(claim_order_job().id, job.id)
+        self.assertEqual(claim_order_job(), None)
+        run_order_job(OrderJob.objects.get(id=job.id))
+        job = OrderJob.objects.get(id=job.id)
+        self.assertEqual((job.status, job.progress, job.total), ("done", 1, 1))
+        self.assertEqual(Process.objects.filter(commitments__independent_demand=order).distinct().count(), 3)
+        self.assertEqual(order.producing_commitments()[0].quantity, Decimal("2"))
+        self.assertTrue(Commitment.objects.filter(independent_demand=order,
+            resource_type=self.red, quantity=Decimal("2")).exists())
+        response = self.client.get(reverse("order_schedule", args=[order.id]))
+        self.assertNotContains(response, "job-bar")
+
+        bad = Order(provider=self.supplier, receiver=self.supplier,
+            due_date=datetime.date(2013, 3, 31))
+        bad.save()
+        queue_order_explosion(bad, [{"resource_type": self.product.id,
+            "quantity": "1", "description": "", "options": []},
+            {"resource_type": self.red.id, "quantity": "1", "description": "", "options": []}])
+        response = self.client.get(reverse("order_schedule", args=[bad.id]))
+        self.assertContains(response, "job-bar")
+        job = run_order_job(claim_order_job())
+        self.assertEqual((job.status, job.progress), ("failed", 1))
+        self.assertFalse(Commitment.objects.filter(independent_demand=bad).exists())
+
+        stale = Order(provider=self.supplier, receiver=self.supplier,
+            due_date=datetime.date(2013, 3, 31))
+        stale.save()
+        queue_order_explosion(stale, [{"resource_type": self.product.id,
+            "quantity": "1", "description": "", "options": [red.id]}])
+        dead = claim_order_job()
+        self.assertEqual(claim_order_job(), None)
+        OrderJob.objects.filter(id=dead.id).update(
+            started=timezone.now() - datetime.timedelta(seconds=ORDER_JOB_TIMEOUT + 60))
+        response = self.client.get(reverse("json_order_job", args=[stale.id]))
+        self.assertTrue(simplejson.loads(response.content)["stale"])
+        job = claim_order_job()
+        self.assertEqual(job.id, dead.id)
+        self.assertEqual(run_order_job(dead).status, "running")
+        self.assertFalse(Commitment.objects.filter(independent_demand=stale).exists())
+        self.assertEqual(requeue_order_jobs(), 1)
+        self.assertEqual(run_order_job(job).status, "pending")
+        job = run_order_job(claim_order_job())
+        self.assertEqual(job.status, "done")
+        self.assertTrue(Commitment.objects.filter(independent_demand=stale).exists())
+
+    def test_create_order_without_lines(self):
+        User.objects.create_user("alice", "alice@example.com", "password")
+        self.client.login(username="alice", password="password")
+        response = self.client.post(reverse("create_order"), {
+            "receiver": self.supplier.id, "provider": self.supplier.id,
+            "due_date": "2013-03-31"})
+        order = Order.objects.get()
+        self.assertRedirects(response, reverse("order_schedule", args=[order.id]))
+        self.assertFalse(OrderJob.objects.exists())
+        response = self.client.get(reverse("order_schedule", args=[order.id]))
+        self.assertNotContains(response, "job-bar")
+
+    def test_network_export(self):
+        rows = list(iter_chunked(EconomicResourceType.objects.all(), ("id", "name"), size=2))
+        self.assertEqual([row[0] for row in rows],
+            list(EconomicResourceType.objects.order_by("id").values_list("id", flat=True)))
+        response = self.client.get(reverse("network_export", args=["jsonl"]))
+        lines = [simplejson.loads(line) for line in response.content.splitlines()]
+        nodes = [line for line in lines if line["type"] == "node"]
+        edges = [line for line in lines if line["type"] == "edge"]
+        self.assertEqual(len(nodes), EconomicAgent.objects.count()
+            + EconomicResourceType.objects.count() + ProcessType.objects.count())
+        self.assertEqual(len(edges), ProcessTypeResourceType.objects.count()
+            + AgentResourceType.objects.count())
+        self.assertTrue({"type": "edge", "label": "produces",
+            "source": self.make_b.node_id(), "target": self.part_b.node_id()} in edges)
+        dot = "".join(export_network("dot"))
+        self.assertTrue(dot.startswith("digraph network {"))
+        self.assertTrue('"%s" -> "%s"' % (self.screw.node_id(), self.make_b.node_id()) in dot)
+        graphml = "".join(export_network("graphml"))
+        self.assertEqual(graphml.count("<edge "), len(edges))
+        response = self.client.get(reverse("network_export", args=["svg"]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_network_export_without_relationships(self):
+        ProcessTypeResourceType(process_type=self.make_a, resource_type=self.blue,
+            quantity=Decimal("1")).save()
+        AgentResourceType(agent=self.supplier, resource_type=self.red).save()
+        for format in ("dot", "graphml", "jsonl"):
+            response = self.client.get(reverse("network_export", args=[format]))
+            self.assertEqual(response.status_code, 200)
+            content = "".join(response)
+            if format == "jsonl":
+                edges = [simplejson.loads(line) for line in content.splitlines()]
+                self.assertTrue({"type": "edge", "label": "", "source": self.blue.node_id(),
+                    "target": self.make_a.node_id()} in edges)
+                self.assertTrue({"type": "edge", "label": "", "source": self.red.node_id(),
+                    "target": self.supplier.node_id()} in edges)
+            elif format == "dot":
+                self.assertTrue(content.endswith("}\n"))
+                self.assertTrue('"%s" -> "%s" [label=""];' % (
+                    self.blue.node_id(), self.make_a.node_id()) in content)
+            else:
+                self.assertTrue(content.endswith("</graphml>\n"))
+
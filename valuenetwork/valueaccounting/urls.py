@@ -10,7 +10,12 @@ urlpatterns = patterns("",
     url(r"^value/(?P<project_id>\d+)/$", 'valuenetwork.valueaccounting.views.value_equation', name="value_equation"),
     url(r"^xbomfg/(?P<resource_type_id>\d+)/$", 'valuenetwork.valueaccounting.views.extended_bill', name="extended_bill"),
     url(r"^edit-xbomfg/(?P<resource_type_id>\d+)/$", 'valuenetwork.valueaccounting.views.edit_extended_bill', name="edit_extended_bill"),
+    url(r"^where-used/(?P<resource_type_id>\d+)/$", 'valuenetwork.valueaccounting.views.where_used', name="where_used"),
+    url(r"^xbill-form/(?P<form_name>[\w-]+)/(?P<object_id>\d+)/$", 'valuenetwork.valueaccounting.views.xbill_form', name="xbill_form"),
     url(r"^network/(?P<resource_type_id>\d+)/$", 'valuenetwork.valueaccounting.views.network', name="network"),
+    url(r"^agent-network/(?P<agent_id>\d+)/$", 'valuenetwork.valueaccounting.views.agent_network_view', name="agent_network"),
+    url(r"^network-metrics/$", 'valuenetwork.valueaccounting.views.network_metrics', name="network_metrics"),
+    url(r"^network-export/(?P<format>\w+)/$", 'valuenetwork.valueaccounting.views.network_export', name="network_export"),
     url(r"^timeline/$", 'valuenetwork.valueaccounting.views.timeline', name="timeline"),
     url(r"^jsontimeline/$", 'valuenetwork.valueaccounting.views.json_timeline', name="json_timeline"),
     url(r"^create-processtype-input/(?P<process_type_id>\d+)/$", 'valuenetwork.valueaccounting.views.create_process_type_input', 
@@ -58,6 +63,24 @@ urlpatterns = patterns("",
         name="delete_source"),
     url(r"^json-resourcetype-unit/(?P<resource_type_id>\d+)/$", 'valuenetwork.valueaccounting.views.json_resource_type_unit', 
         name="json_resource_type_unit"),
+    url(r"^json-xbill-children/(?P<node_id>[\w-]+)/$", 'valuenetwork.valueaccounting.views.json_xbill_children', 
+        name="json_xbill_children"),
+    url(r"^json-where-used/(?P<resource_type_id>\d+)/$", 'valuenetwork.valueaccounting.views.json_where_used', 
+        name="json_where_used"),
+    url(r"^json-flattened-bill/(?P<resource_type_id>\d+)/$", 'valuenetwork.valueaccounting.views.json_flattened_bill', 
+        name="json_flattened_bill"),
+    url(r"^flattened-bill-csv/(?P<resource_type_id>\d+)/$", 'valuenetwork.valueaccounting.views.flattened_bill_csv', 
+        name="flattened_bill_csv"),
+    url(r"^json-resourcetype-cost/(?P<resource_type_id>\d+)/$", 'valuenetwork.valueaccounting.views.json_resource_type_cost', 
+        name="json_resource_type_cost"),
+    url(r"^json-xbill-choices/$", 'valuenetwork.valueaccounting.views.json_xbill_choices', 
+        name="json_xbill_choices"),
+    url(r"^json-critical-path/(?P<order_id>\d+)/$", 'valuenetwork.valueaccounting.views.json_critical_path', 
+        name="json_critical_path"),
+    url(r"^json-order-job/(?P<order_id>\d+)/$", 'valuenetwork.valueaccounting.views.json_order_job', 
+        name="json_order_job"),
+    url(r"^json-xbill-cache-stats/$", 'valuenetwork.valueaccounting.views.json_xbill_cache_stats', 
+        name="json_xbill_cache_stats"),
     url(r"^create-order/$", 'valuenetwork.valueaccounting.views.create_order', name="create_order"),
     url(r"^order-schedule/(?P<order_id>\d+)/$", 'valuenetwork.valueaccounting.views.order_schedule', name="order_schedule"),
     url(r"^delete-order/(?P<order_id>\d+)/$", 'valuenetwork.valueaccounting.views.delete_order', name="delete_order"),
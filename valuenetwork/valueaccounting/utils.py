@@ -1,8 +1,24 @@
 import datetime
+import hashlib
+import heapq
+import math
+import multiprocessing
+import random
+from xml.sax.saxutils import escape, quoteattr
+import threading
+from contextlib import contextmanager
+import time
 from itertools import chain, imap
+from json.encoder import encode_basestring_ascii
+from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
+from django.db.models import F, Q, Count, Max, Min, Sum
+from django.utils import simplejson, timezone
 
-from valuenetwork.valueaccounting.models import Commitment, Process
+from valuenetwork.valueaccounting.models import *
 
 def split_thousands(n, sep=','):
     s = str(n)
@@ -34,33 +50,636 @@ class Edge(object):
         self.width = 1
 
 
-def explode(process_type_relationship, nodes, edges, depth, depth_limit):
-    if depth > depth_limit:
-        return
-    nodes.append(process_type_relationship.process_type)
-    edges.append(Edge(
-        process_type_relationship.process_type, 
-        process_type_relationship.resource_type, 
-        process_type_relationship.relationship.name
-    ))
-    for rtr in process_type_relationship.process_type.consumed_resource_type_relationships():
-        nodes.append(rtr.resource_type)
-        edges.append(Edge(rtr.resource_type, process_type_relationship.process_type, rtr.inverse_label()))
-        for art in rtr.resource_type.producing_agent_relationships():
-            nodes.append(art.agent)
-            edges.append(Edge(art.agent, rtr.resource_type, art.relationship.name))
-        for pt in rtr.resource_type.producing_process_type_relationships():
-            explode(pt, nodes, edges, depth+1, depth_limit)
+class XbillCycleError(Exception):
+    """
+    Raised when a recipe leads back to itself, e.g. a resource type
+    consumed (directly or not) by a process type that produces it.
+    ``cycle`` is the list of xbill objects around the loop, starting and
+    ending with the same one.
+    """
+    def __init__(self, cycle):
+        self.cycle = cycle
+        super(XbillCycleError, self).__init__(unicode(self).encode("utf-8"))
+
+    def __unicode__(self):
+        return u"Recipe cycle: %s" % u" -> ".join(unicode(obj) for obj in self.cycle)
+
+def check_xbill_cycle(path, xbill_object):
+    """
+    Raises XbillCycleError if ``xbill_object`` is already on ``path``,
+    the list of xbill objects being exploded above it.
+    """
+    node_id = xbill_object.node_id()
+    for i, obj in enumerate(path):
+        if obj.node_id() == node_id:
+            raise XbillCycleError(path[i:] + [xbill_object])
+
+class Graph(object):
+    """
+    Nodes and edges of a network diagram, deduplicated: a node is kept
+    once per ``node_id()`` and parallel edges (same ends and label)
+    are merged into one Edge with a bigger ``width``.
+    """
+    def __init__(self):
+        self.nodes = []
+        self.edges = []
+        self.node_ids = set()
+        self.edge_index = {}
+
+    def add_node(self, node):
+        node_id = node.node_id()
+        if not node_id in self.node_ids:
+            self.node_ids.add(node_id)
+            self.nodes.append(node)
+
+    def add_edge(self, from_node, to_node, label):
+        key = (from_node.node_id(), to_node.node_id(), label)
+        if key in self.edge_index:
+            self.edge_index[key].width += 1
+        else:
+            edge = Edge(from_node, to_node, label)
+            self.edge_index[key] = edge
+            self.edges.append(edge)
+
 
 def graphify(focus, depth_limit):
-    nodes = [focus]
-    edges = []
-    for art in focus.consuming_agent_relationships():
-        nodes.append(art.agent)
-        edges.append(Edge(focus, art.agent, art.relationship.name))
-    for ptr in focus.producing_process_type_relationships():
-        explode(ptr, nodes, edges, 0, depth_limit)
-    return [nodes, edges]
+    """
+    The value network of ``focus``: the process types producing it
+    down to ``depth_limit`` levels, with what they consume and the
+    agents producing that.
+    Loaded breadth-first, with one query per relationship kind per
+    level; each resource type is expanded once, however many paths
+    lead to it.
+    """
+    graph = Graph()
+    graph.add_node(focus)
+    for art in focus.consuming_agent_relationships().select_related(
+            'agent', 'relationship'):
+        graph.add_node(art.agent)
+        graph.add_edge(focus, art.agent, art.relationship.name)
+    rt_ids = set([focus.id])
+    seen_rts = set(rt_ids)
+    seen_pts = set()
+    depth = 0
+    while rt_ids and depth <= depth_limit:
+        pt_ids = set()
+        for ids in chunks(rt_ids):
+            ptrts = ProcessTypeResourceType.objects.filter(
+                resource_type__id__in=ids,
+                relationship__direction='out').select_related(
+                'process_type', 'resource_type', 'relationship')
+            for ptrt in ptrts:
+                graph.add_node(ptrt.process_type)
+                graph.add_edge(ptrt.process_type, ptrt.resource_type, ptrt.relationship.name)
+                if not ptrt.process_type_id in seen_pts:
+                    seen_pts.add(ptrt.process_type_id)
+                    pt_ids.add(ptrt.process_type_id)
+        next_rts = set()
+        for ids in chunks(pt_ids):
+            ptrts = ProcessTypeResourceType.objects.filter(
+                process_type__id__in=ids,
+                relationship__direction='in').select_related(
+                'process_type', 'resource_type', 'relationship')
+            for ptrt in ptrts:
+                graph.add_node(ptrt.resource_type)
+                graph.add_edge(ptrt.resource_type, ptrt.process_type, ptrt.inverse_label())
+                if not ptrt.resource_type_id in seen_rts:
+                    seen_rts.add(ptrt.resource_type_id)
+                    next_rts.add(ptrt.resource_type_id)
+        for ids in chunks(next_rts):
+            arts = AgentResourceType.objects.filter(
+                resource_type__id__in=ids,
+                relationship__direction='out').select_related(
+                'agent', 'resource_type', 'relationship')
+            for art in arts:
+                graph.add_node(art.agent)
+                graph.add_edge(art.agent, art.resource_type, art.relationship.name)
+        rt_ids = next_rts
+        depth += 1
+    return [graph.nodes, graph.edges]
+
+def agent_network(agent, hops):
+    """
+    The value network around ``agent``, out to ``hops`` agents away:
+    the resource types each agent produces or consumes, the process
+    types using those, and the other agents producing or consuming
+    them, who are the next hop.
+    Loaded a hop at a time, with three queries per hop.
+    """
+    graph = Graph()
+    graph.add_node(agent)
+    agent_ids = set([agent.id])
+    seen_agents = set(agent_ids)
+    seen_rts = set()
+    hop = 0
+    while agent_ids and hop < hops:
+        rt_ids = set()
+        for ids in chunks(agent_ids):
+            arts = AgentResourceType.objects.filter(
+                agent__id__in=ids).select_related(
+                'agent', 'resource_type', 'relationship')
+            for art in arts:
+                add_agent_resource_edge(graph, art)
+                if not art.resource_type_id in seen_rts:
+                    seen_rts.add(art.resource_type_id)
+                    rt_ids.add(art.resource_type_id)
+        for ids in chunks(rt_ids):
+            ptrts = ProcessTypeResourceType.objects.filter(
+                resource_type__id__in=ids).select_related(
+                'process_type', 'resource_type', 'relationship')
+            for ptrt in ptrts:
+                graph.add_node(ptrt.process_type)
+                graph.add_node(ptrt.resource_type)
+                if ptrt.relationship_id and ptrt.relationship.direction == 'out':
+                    graph.add_edge(ptrt.process_type, ptrt.resource_type, ptrt.relationship.name)
+                else:
+                    graph.add_edge(ptrt.resource_type, ptrt.process_type,
+                        ptrt.relationship_id and ptrt.inverse_label() or "")
+        next_agents = set()
+        for ids in chunks(rt_ids):
+            arts = AgentResourceType.objects.filter(
+                resource_type__id__in=ids).select_related(
+                'agent', 'resource_type', 'relationship')
+            for art in arts:
+                add_agent_resource_edge(graph, art)
+                if art.agent_id in seen_agents:
+                    continue
+                next_agents.add(art.agent_id)
+        seen_agents.update(next_agents)
+        agent_ids = next_agents
+        hop += 1
+    return [graph.nodes, graph.edges]
+
+def add_agent_resource_edge(graph, art):
+    graph.add_node(art.agent)
+    graph.add_node(art.resource_type)
+    if art.relationship_id and art.relationship.direction == 'out':
+        graph.add_edge(art.agent, art.resource_type, art.relationship.name)
+    else:
+        graph.add_edge(art.resource_type, art.agent,
+            art.relationship_id and art.relationship.name or "")
+
+NETWORK_LAYOUT_ITERATIONS = getattr(settings, "NETWORK_LAYOUT_ITERATIONS", 200)
+# node iterations a layout may take in a request: bigger graphs get
+# fewer iterations, but never less than NETWORK_LAYOUT_MIN_ITERATIONS
+NETWORK_LAYOUT_BUDGET = getattr(settings, "NETWORK_LAYOUT_BUDGET", 20000)
+NETWORK_LAYOUT_MIN_ITERATIONS = getattr(settings, "NETWORK_LAYOUT_MIN_ITERATIONS", 20)
+
+def layout_iterations(count):
+    return max(NETWORK_LAYOUT_MIN_ITERATIONS,
+        min(NETWORK_LAYOUT_ITERATIONS, NETWORK_LAYOUT_BUDGET / max(count, 1)))
+
+def spring_layout(nodes, edges, iterations=NETWORK_LAYOUT_ITERATIONS, seed=0, start=None):
+    """
+    Lays out ``nodes`` and ``edges`` (as returned by graphify) with the
+    spring layout of dracula_graph.js, so the browser only has to draw.
+    Repulsion only reaches nodes in neighbouring grid cells, which is
+    all the javascript version's max distance lets through anyway.
+    ``start`` is an earlier layout to carry on from, for the nodes it has.
+    Returns {node_id: (x, y)} scaled into 0..1.
+    """
+    k = 2.0
+    c = 0.01
+    max_distance = 6.0
+    max_move = 0.5
+    rand = random.Random(seed)
+    ids = [node.node_id() for node in nodes]
+    index = dict((node_id, i) for i, node_id in enumerate(ids))
+    count = len(ids)
+    spread = math.sqrt(count) * k
+    xs = [rand.uniform(0, spread) for i in range(count)]
+    ys = [rand.uniform(0, spread) for i in range(count)]
+    for node_id, (x, y) in (start or {}).items():
+        if node_id in index:
+            xs[index[node_id]] = x * spread
+            ys[index[node_id]] = y * spread
+    links = []
+    for edge in edges:
+        from_id = edge.from_node.node_id()
+        to_id = edge.to_node.node_id()
+        if from_id in index and to_id in index and from_id != to_id:
+            links.append((index[from_id], index[to_id]))
+
+    def separate(i, j):
+        dx = xs[j] - xs[i]
+        dy = ys[j] - ys[i]
+        d2 = dx * dx + dy * dy
+        if d2 < 0.01:
+            dx = 0.1 * rand.random() + 0.1
+            dy = 0.1 * rand.random() + 0.1
+            d2 = dx * dx + dy * dy
+        return dx, dy, d2
+
+    for iteration in range(iterations):
+        fxs = [0.0] * count
+        fys = [0.0] * count
+        grid = {}
+        for i in range(count):
+            cell = (int(math.floor(xs[i] / max_distance)), int(math.floor(ys[i] / max_distance)))
+            grid.setdefault(cell, []).append(i)
+        for (cx, cy), members in grid.items():
+            for ox in (-1, 0, 1):
+                for oy in (-1, 0, 1):
+                    others = grid.get((cx + ox, cy + oy))
+                    if not others:
+                        continue
+                    for i in members:
+                        for j in others:
+                            if j <= i:
+                                continue
+                            dx, dy, d2 = separate(i, j)
+                            d = math.sqrt(d2)
+                            if d < max_distance:
+                                force = k * k / d
+                                fxs[j] += force * dx / d
+                                fys[j] += force * dy / d
+                                fxs[i] -= force * dx / d
+                                fys[i] -= force * dy / d
+        for i, j in links:
+            dx, dy, d2 = separate(i, j)
+            d = math.sqrt(d2)
+            if d > max_distance:
+                d = max_distance
+                d2 = d * d
+            force = (d2 - k * k) / k
+            fxs[j] -= force * dx / d
+            fys[j] -= force * dy / d
+            fxs[i] += force * dx / d
+            fys[i] += force * dy / d
+        for i in range(count):
+            xs[i] += max(-max_move, min(max_move, c * fxs[i]))
+            ys[i] += max(-max_move, min(max_move, c * fys[i]))
+
+    def scale(values):
+        low = min(values or [0])
+        high = max(values or [0])
+        if high == low:
+            return [0.5 for value in values]
+        return [(value - low) / (high - low) for value in values]
+
+    return dict(zip(ids, zip(scale(xs), scale(ys))))
+
+def cached_network_layout(resource_type, depth, nodes, edges):
+    """
+    spring_layout of the network of ``resource_type`` to ``depth``,
+    cached under its xbill_version.  Laid out again if the graph has
+    nodes the cached layout lacks: from the last layout if there is
+    one, which only needs settling, else from scratch with
+    layout_iterations, so big graphs stay quick.
+    """
+    last_key = "network-layout-%s-%s" % (resource_type.id, depth)
+    key = "-".join([last_key, str(xbill_version(resource_type.id))])
+    layout = cache.get(key)
+    if layout is None or [node for node in nodes if not node.node_id() in layout]:
+        last = cache.get(last_key)
+        iterations = layout_iterations(len(nodes))
+        if last:
+            iterations = max(5, iterations / 4)
+        layout = spring_layout(nodes, edges, iterations, seed=resource_type.id, start=last)
+        cache.set_many({key: layout, last_key: layout}, XBILL_CACHE_TIMEOUT)
+    return layout
+
+def cache_versions(names):
+    """
+    {name: version} of the CacheVersions ``names``, 0 for those never
+    bumped, in one query per 500 names.
+    """
+    versions = dict((name, 0) for name in names)
+    for batch in chunks(versions):
+        versions.update(CacheVersion.objects.filter(
+            name__in=batch).values_list("name", "version"))
+    return versions
+
+def bump_cache_versions(names):
+    names = set(names)
+    for batch in chunks(names):
+        CacheVersion.objects.filter(name__in=batch).update(version=F("version") + 1)
+        missing = set(batch) - set(CacheVersion.objects.filter(
+            name__in=batch).values_list("name", flat=True))
+        for name in missing:
+            version, created = CacheVersion.objects.get_or_create(
+                name=name, defaults={"version": 1})
+            if not created:
+                # someone else created it first
+                CacheVersion.objects.filter(name=name).update(version=F("version") + 1)
+
+NETWORK_VERSION_NAME = "network"
+
+def network_version():
+    """
+    The current version of the value network as a whole, bumped by
+    any change to a relationship or a name, see the signal handlers
+    in models.
+    """
+    return cache_versions([NETWORK_VERSION_NAME])[NETWORK_VERSION_NAME]
+
+def bump_network_version():
+    bump_cache_versions([NETWORK_VERSION_NAME])
+
+def cached_agent_network(agent, hops):
+    """
+    agent_network of ``agent`` to ``hops``, with each node's layout_x
+    and layout_y from spring_layout, cached per network_version.
+    """
+    key = "agent-network-%s-%s-%s" % (agent.id, hops, network_version())
+    nodes_and_edges = cache.get(key)
+    if nodes_and_edges is None:
+        nodes, edges = agent_network(agent, hops)
+        layout = spring_layout(nodes, edges, layout_iterations(len(nodes)), seed=agent.id)
+        for node in nodes:
+            node.layout_x, node.layout_y = layout[node.node_id()]
+        nodes_and_edges = [nodes, edges]
+        cache.set(key, nodes_and_edges, XBILL_CACHE_TIMEOUT)
+    return nodes_and_edges
+
+NETWORK_EXPORT_CHUNK = 1000
+NETWORK_EXPORT_FORMATS = {
+    "dot": "text/vnd.graphviz",
+    "graphml": "application/xml",
+    "jsonl": "application/x-ndjson",
+}
+
+def iter_chunked(queryset, fields, size=NETWORK_EXPORT_CHUNK):
+    """
+    Yields ``fields`` value tuples of ``queryset``, the first being id,
+    ``size`` rows per query in id order, so no more than one chunk is
+    ever held in memory.
+    """
+    last_id = 0
+    while True:
+        count = 0
+        for row in queryset.filter(id__gt=last_id).order_by("id").values_list(
+                *fields)[:size].iterator():
+            count += 1
+            last_id = row[0]
+            yield row
+        if count < size:
+            break
+
+def network_nodes():
+    """
+    (node_id, label, color) of every agent, resource type and
+    process type, colored as on the network diagram.
+    """
+    for model, prefix, color in (
+            (EconomicAgent, "Agent", "green"),
+            (EconomicResourceType, "ResourceType", "red"),
+            (ProcessType, "ProcessType", "blue")):
+        for pk, name in iter_chunked(model.objects.all(), ("id", "name")):
+            yield "%s-%s" % (prefix, pk), name, color
+
+def network_edges():
+    """
+    (from_node_id, to_node_id, label) of every relationship, pointed
+    the same way as graphify's edges.  A row without a relationship
+    has no direction to follow: it points from the resource type to
+    the process type or agent, like an input, and has an empty label.
+    """
+    rel_fields = ("relationship__direction", "relationship__name", "relationship__inverse_name")
+    for pk, pt_id, rt_id, direction, name, inverse in iter_chunked(
+            ProcessTypeResourceType.objects.all(),
+            ("id", "process_type", "resource_type") + rel_fields):
+        if direction == "out":
+            yield "ProcessType-%s" % pt_id, "ResourceType-%s" % rt_id, name or ""
+        elif direction is None:
+            yield "ResourceType-%s" % rt_id, "ProcessType-%s" % pt_id, ""
+        else:
+            yield "ResourceType-%s" % rt_id, "ProcessType-%s" % pt_id, inverse or name or ""
+    for pk, agent_id, rt_id, direction, name, inverse in iter_chunked(
+            AgentResourceType.objects.all(),
+            ("id", "agent", "resource_type") + rel_fields):
+        if direction == "out":
+            yield "Agent-%s" % agent_id, "ResourceType-%s" % rt_id, name or ""
+        elif direction is None:
+            yield "ResourceType-%s" % rt_id, "Agent-%s" % agent_id, ""
+        else:
+            yield "ResourceType-%s" % rt_id, "Agent-%s" % agent_id, name or ""
+
+def dot_string(value):
+    return '"%s"' % value.replace("\\", "\\\\").replace('"', '\\"')
+
+def export_network(format):
+    """
+    Streams the whole value network as utf-8 lines of
+    graphviz dot, graphml or json lines (one object per node or edge).
+    """
+    if format == "dot":
+        yield "digraph network {\n"
+        for node_id, label, color in network_nodes():
+            yield (u'  %s [label=%s, color=%s];\n' % (
+                dot_string(node_id), dot_string(label), color)).encode("utf-8")
+        for from_id, to_id, label in network_edges():
+            yield (u'  %s -> %s [label=%s];\n' % (
+                dot_string(from_id), dot_string(to_id), dot_string(label))).encode("utf-8")
+        yield "}\n"
+    elif format == "graphml":
+        yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+        yield '<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n'
+        yield '  <key id="label" for="all" attr.name="label" attr.type="string"/>\n'
+        yield '  <key id="color" for="node" attr.name="color" attr.type="string"/>\n'
+        yield '  <graph id="network" edgedefault="directed">\n'
+        for node_id, label, color in network_nodes():
+            yield (u'    <node id=%s><data key="label">%s</data><data key="color">%s</data></node>\n' % (
+                quoteattr(node_id), escape(label), color)).encode("utf-8")
+        for from_id, to_id, label in network_edges():
+            yield (u'    <edge source=%s target=%s><data key="label">%s</data></edge>\n' % (
+                quoteattr(from_id), quoteattr(to_id), escape(label))).encode("utf-8")
+        yield "  </graph>\n</graphml>\n"
+    elif format == "jsonl":
+        for node_id, label, color in network_nodes():
+            yield simplejson.dumps({
+                "type": "node", "id": node_id, "label": label, "color": color}) + "\n"
+        for from_id, to_id, label in network_edges():
+            yield simplejson.dumps({
+                "type": "edge", "source": from_id, "target": to_id, "label": label}) + "\n"
+    else:
+        raise ValueError("Unknown network export format: %s" % format)
+
+def network_adjacency():
+    """
+    The whole value network as {node_id: [successor node_ids]},
+    from network_nodes and network_edges.
+    """
+    succs = {}
+    for node_id, label, color in network_nodes():
+        succs[node_id] = set()
+    for from_id, to_id, label in network_edges():
+        succs.setdefault(from_id, set()).add(to_id)
+        succs.setdefault(to_id, set())
+    return dict((node_id, sorted(ids)) for node_id, ids in succs.iteritems())
+
+# the network the network metric workers compute over,
+# set in each pool process by set_metric_network
+METRIC_NETWORK = {}
+
+def set_metric_network(succs, preds, products):
+    METRIC_NETWORK["succs"] = succs
+    METRIC_NETWORK["preds"] = preds
+    METRIC_NETWORK["products"] = products
+
+def betweenness_for_sources(sources):
+    """
+    Brandes' betweenness, summed over the shortest paths starting
+    at ``sources`` only, so the sources can be shared out to workers.
+    """
+    succs = METRIC_NETWORK["succs"]
+    scores = {}
+    for source in sources:
+        stack = []
+        path_preds = {}
+        sigma = {source: 1}
+        distance = {source: 0}
+        queue = [source]
+        i = 0
+        while i < len(queue):
+            v = queue[i]
+            i += 1
+            stack.append(v)
+            for w in succs[v]:
+                if not w in distance:
+                    distance[w] = distance[v] + 1
+                    queue.append(w)
+                if distance[w] == distance[v] + 1:
+                    sigma[w] = sigma.get(w, 0) + sigma[v]
+                    path_preds.setdefault(w, []).append(v)
+        delta = {}
+        while stack:
+            w = stack.pop()
+            for v in path_preds.get(w, []):
+                delta[v] = delta.get(v, 0.0) + float(sigma[v]) / sigma[w] * (1 + delta.get(w, 0.0))
+            if w != source and delta.get(w):
+                scores[w] = scores.get(w, 0.0) + delta[w]
+    return scores
+
+def blocked_products_for_nodes(node_ids):
+    """
+    How many end products each of ``node_ids`` would block if it
+    failed.  A resource type fails when all its sources (producing
+    process types and supplying agents) have failed, a process type
+    when any of its inputs has.
+    """
+    succs = METRIC_NETWORK["succs"]
+    preds = METRIC_NETWORK["preds"]
+    products = METRIC_NETWORK["products"]
+    counts = {}
+    for node_id in node_ids:
+        failed = set([node_id])
+        remaining = {}
+        queue = [node_id]
+        while queue:
+            v = queue.pop()
+            for w in succs[v]:
+                if w in failed:
+                    continue
+                if w.startswith("ProcessType-"):
+                    failed.add(w)
+                    queue.append(w)
+                elif w.startswith("ResourceType-"):
+                    remaining[w] = remaining.get(w, len(preds[w])) - 1
+                    if not remaining[w]:
+                        failed.add(w)
+                        queue.append(w)
+        failed.discard(node_id)
+        counts[node_id] = len(failed & products)
+    return counts
+
+def refresh_network_metrics(processes=None, force=False):
+    """
+    Recomputes the NetworkMetric rows of all agents and resource types
+    unless the network is unchanged since the last run (or ``force``).
+    The per-node work is shared out to a pool of ``processes`` worker
+    processes (one per cpu by default, none if 1), and only rows whose
+    metrics changed are written.
+    Returns {"created": n, "updated": n, "deleted": n}, or None if
+    nothing needed recomputing.
+    """
+    version = network_version()
+    if not force and NetworkMetric.objects.exists() and not \
+            NetworkMetric.objects.exclude(network_version=version).exists():
+        return None
+    succs = network_adjacency()
+    preds = dict((node_id, []) for node_id in succs)
+    for node_id, ids in succs.iteritems():
+        for succ_id in ids:
+            preds[succ_id].append(node_id)
+    products = set(node_id for node_id in succs
+        if node_id.startswith("ResourceType-")
+        and [pred for pred in preds[node_id] if pred.startswith("ProcessType-")]
+        and not [succ for succ in succs[node_id] if succ.startswith("ProcessType-")])
+    metric_ids = [node_id for node_id in succs
+        if node_id.startswith("Agent-") or node_id.startswith("ResourceType-")]
+
+    processes = processes or multiprocessing.cpu_count()
+    sources = list(chunks(succs, max(1, len(succs) / (processes * 4) + 1)))
+    targets = list(chunks(metric_ids, max(1, len(metric_ids) / (processes * 4) + 1)))
+    if processes > 1:
+        pool = multiprocessing.Pool(processes, set_metric_network, (succs, preds, products))
+        try:
+            betweenness_parts = pool.map(betweenness_for_sources, sources)
+            blocked_parts = pool.map(blocked_products_for_nodes, targets)
+        finally:
+            pool.terminate()
+    else:
+        set_metric_network(succs, preds, products)
+        betweenness_parts = map(betweenness_for_sources, sources)
+        blocked_parts = map(blocked_products_for_nodes, targets)
+    betweenness = {}
+    for part in betweenness_parts:
+        for node_id, score in part.iteritems():
+            betweenness[node_id] = betweenness.get(node_id, 0.0) + score
+    blocked = {}
+    for part in blocked_parts:
+        blocked.update(part)
+
+    existing = dict((row[0], row[1:]) for row in NetworkMetric.objects.values_list(
+        "node_id", "id", "degree", "betweenness", "blocked_products"))
+    created = []
+    updated = 0
+    for node_id in metric_ids:
+        values = (
+            len(set(succs[node_id]) | set(preds[node_id])),
+            round(betweenness.get(node_id, 0.0), 6),
+            blocked[node_id],
+        )
+        if node_id in existing:
+            row = existing.pop(node_id)
+            if row[1:] != values:
+                NetworkMetric.objects.filter(id=row[0]).update(
+                    degree=values[0], betweenness=values[1], blocked_products=values[2])
+                updated += 1
+        else:
+            prefix, pk = node_id.split("-")
+            metric = NetworkMetric(node_id=node_id,
+                degree=values[0], betweenness=values[1], blocked_products=values[2],
+                network_version=version)
+            if prefix == "Agent":
+                metric.agent_id = int(pk)
+            else:
+                metric.resource_type_id = int(pk)
+            created.append(metric)
+    for batch in chunks(created):
+        NetworkMetric.objects.bulk_create(batch)
+    for ids in chunks([row[0] for row in existing.values()]):
+        NetworkMetric.objects.filter(id__in=ids).delete()
+    NetworkMetric.objects.exclude(network_version=version).update(network_version=version)
+    return {"created": len(created), "updated": updated, "deleted": len(existing)}
+
+TIMELINE_DATE_FORMAT = "%b %e %Y 00:00:00 GMT-0600"
+
+timeline_dates = {}
+
+def format_timeline_date(date):
+    """
+    ``date`` as the timeline wants it.  Timelines repeat the same few
+    hundred dates over and over, so each is only formatted once.
+    """
+    try:
+        return timeline_dates[date]
+    except KeyError:
+        if len(timeline_dates) > 10000:
+            timeline_dates.clear()
+        formatted = timeline_dates[date] = date.strftime(TIMELINE_DATE_FORMAT)
+        return formatted
 
 class TimelineEvent(object):
     def __init__(self, node, start, end, title, link, description):
@@ -73,12 +692,12 @@ class TimelineEvent(object):
 
     def dictify(self):
         d = {
-            "start": self.start.strftime("%b %e %Y 00:00:00 GMT-0600"),
+            "start": format_timeline_date(self.start),
             "title": self.title,
             "description": self.description,
         }
         if self.end:
-            d["end"] = self.end.strftime("%b %e %Y 00:00:00 GMT-0600")
+            d["end"] = format_timeline_date(self.end)
             d["durationEvent"] = True
         else:
             d["durationEvent"] = False
@@ -86,31 +705,169 @@ class TimelineEvent(object):
             d["link"] = self.link
         return d
 
+class BackscheduleGraph(object):
+    """
+    The recipe DAG below ``resource_types`` for backscheduling: who
+    produces each resource type, agents or process types, and what
+    each process type consumes.  Loaded breadth-first with three
+    queries per level, and sorted topologically once, parents first,
+    so ``latest_dates`` is a single pass however many paths lead to
+    a shared component.
+    Raises XbillCycleError if the recipe has a cycle.
+    """
+    def __init__(self, resource_types):
+        self.resource_types = {}
+        self.process_types = {}
+        self.suppliers = {}
+        self.producers = {}
+        self.inputs = {}
+        self.roots = []
+        for rt in resource_types:
+            if not rt.id in self.resource_types:
+                self.resource_types[rt.id] = rt
+                self.roots.append(("ResourceType", rt.id))
+        self.load()
+        self.order = self.sort()
+
+    def load(self):
+        rt_ids = set(self.resource_types)
+        while rt_ids:
+            pt_ids = set()
+            for ids in chunks(rt_ids):
+                arts = AgentResourceType.objects.filter(
+                    resource_type__id__in=ids,
+                    relationship__direction='out').select_related(
+                    'agent', 'resource_type')
+                for art in arts:
+                    self.suppliers.setdefault(art.resource_type_id, []).append(art)
+                ptrts = ProcessTypeResourceType.objects.filter(
+                    resource_type__id__in=ids,
+                    relationship__direction='out').select_related('process_type')
+                for ptrt in ptrts:
+                    self.producers.setdefault(ptrt.resource_type_id, []).append(ptrt.process_type_id)
+                    if not ptrt.process_type_id in self.process_types:
+                        self.process_types[ptrt.process_type_id] = ptrt.process_type
+                        pt_ids.add(ptrt.process_type_id)
+            rt_ids = set()
+            for ids in chunks(pt_ids):
+                ptrts = ProcessTypeResourceType.objects.filter(
+                    process_type__id__in=ids,
+                    relationship__direction='in').select_related('resource_type')
+                for ptrt in ptrts:
+                    self.inputs.setdefault(ptrt.process_type_id, []).append(ptrt.resource_type_id)
+                    if not ptrt.resource_type_id in self.resource_types:
+                        self.resource_types[ptrt.resource_type_id] = ptrt.resource_type
+                        rt_ids.add(ptrt.resource_type_id)
+
+    def successors(self, node):
+        kind, pk = node
+        if kind == "ResourceType":
+            return [("ProcessType", pt_id) for pt_id in self.producers.get(pk, [])]
+        return [("ResourceType", rt_id) for rt_id in self.inputs.get(pk, [])]
+
+    def model(self, node):
+        kind, pk = node
+        if kind == "ResourceType":
+            return self.resource_types[pk]
+        return self.process_types[pk]
+
+    def sort(self):
+        """
+        The resource and process types in topological order, by an
+        iterative depth first search, so deep recipes don't recurse.
+        """
+        done = set()
+        post_order = []
+        for root in self.roots:
+            if root in done:
+                continue
+            path = [root]
+            on_path = set(path)
+            stack = [iter(self.successors(root))]
+            while stack:
+                for child in stack[-1]:
+                    if child in on_path:
+                        cycle = path[path.index(child):] + [child]
+                        raise XbillCycleError([self.model(node) for node in cycle])
+                    if not child in done:
+                        path.append(child)
+                        on_path.add(child)
+                        stack.append(iter(self.successors(child)))
+                        break
+                else:
+                    stack.pop()
+                    node = path.pop()
+                    on_path.discard(node)
+                    done.add(node)
+                    post_order.append(node)
+        post_order.reverse()
+        return post_order
+
+    def latest_dates(self, need_dates):
+        """
+        The latest date each resource type is needed by, and the latest
+        (start, end) of each process type, for the roots to be ready on
+        ``need_dates``, {resource_type_id: date}.
+        A component is needed by the earliest start of the process
+        types consuming it.
+        """
+        needed = dict(need_dates)
+        process_dates = {}
+        ends = {}
+        for kind, pk in self.order:
+            if kind == "ResourceType":
+                if not pk in needed:
+                    continue
+                for pt_id in self.producers.get(pk, []):
+                    if not pt_id in ends or needed[pk] < ends[pt_id]:
+                        ends[pt_id] = needed[pk]
+            elif pk in ends:
+                pt = self.process_types[pk]
+                start = ends[pk] - datetime.timedelta(days=(pt.estimated_duration/1440))
+                process_dates[pk] = (start, ends[pk])
+                for rt_id in self.inputs.get(pk, []):
+                    if not rt_id in needed or start < needed[rt_id]:
+                        needed[rt_id] = start
+        return needed, process_dates
+
+    def timeline_events(self, need_dates):
+        """
+        TimelineEvents for the supply of each resource type and each
+        process type, at their latest_dates, in topological order.
+        """
+        needed, process_dates = self.latest_dates(need_dates)
+        events = []
+        for kind, pk in self.order:
+            if kind == "ResourceType":
+                if not pk in needed:
+                    continue
+                rt = self.resource_types[pk]
+                for art in self.suppliers.get(pk, []):
+                    events.append(TimelineEvent(
+                        art,
+                        needed[pk] - datetime.timedelta(days=art.lead_time),
+                        "",
+                        art.timeline_title(),
+                        rt.url,
+                        rt.description,
+                    ))
+            elif pk in process_dates:
+                pt = self.process_types[pk]
+                start, end = process_dates[pk]
+                events.append(TimelineEvent(
+                    pt,
+                    start,
+                    end,
+                    pt.timeline_title(),
+                    pt.url,
+                    pt.description,
+                ))
+        return events
+
 def explode_events(resource_type, backsked_date, events):
-    for art in resource_type.producing_agent_relationships():
-        order_date = backsked_date - datetime.timedelta(days=art.lead_time)
-        te = TimelineEvent(
-            art,
-            order_date,
-            "",
-            art.timeline_title(),
-            resource_type.url,
-            resource_type.description,
-        )
+    graph = BackscheduleGraph([resource_type])
+    for te in graph.timeline_events({resource_type.id: backsked_date}):
         events['events'].append(te.dictify())
-    for pp in resource_type.producing_process_types():
-        start_date = backsked_date - datetime.timedelta(days=(pp.estimated_duration/1440))
-        ppte = TimelineEvent(
-            pp,
-            start_date,
-            backsked_date,
-            pp.timeline_title(),
-            pp.url,
-            pp.description,
-        )
-        events['events'].append(ppte.dictify())
-        for crt in pp.consumed_resource_types():
-            explode_events(crt, start_date, events)
 
 def backschedule_process_types(commitment, process_type,events):
     lead_time=1
@@ -130,113 +887,913 @@ def backschedule_process_types(commitment, process_type,events):
         process_type.description,
     )
     events['events'].append(ppte.dictify())
-    for crt in process_type.consumed_resource_types():
-        explode_events(crt, start_date, events)
+    crts = process_type.consumed_resource_types()
+    graph = BackscheduleGraph(crts)
+    for te in graph.timeline_events(dict((crt.id, start_date) for crt in crts)):
+        events['events'].append(te.dictify())
 
 def backschedule_process(order, process, events):
-    te = TimelineEvent(
+    events.append(TimelineEvent(
         process,
         process.start_date,
         process.end_date,
         process.timeline_title(),
         process.url,
         process.notes,
-    )
-    events['events'].append(te.dictify())
+    ))
     for ic in process.incoming_commitments():
-        te = TimelineEvent(
+        events.append(TimelineEvent(
             ic,
             ic.due_date,
             "",
             ic.timeline_title(),
             ic.url,
             ic.description,
-        )
-        events['events'].append(te.dictify())
+        ))
         resource_type = ic.resource_type
         pcs = resource_type.producing_commitments()
         if pcs:
             for pc in pcs:
                 if pc.independent_demand == order:
-                    te = TimelineEvent(
+                    events.append(TimelineEvent(
                         pc,
                         pc.due_date,
                         "",
                         pc.timeline_title(),
                         pc.url,
                         pc.description,
-                    )
-                    events['events'].append(te.dictify())
+                    ))
                     backschedule_process(order, pc.process, events)
 
     return events
 
 def backschedule_order(order, events):
-    te = TimelineEvent(
+    """
+    Appends the TimelineEvents of ``order``'s schedule to ``events``:
+    the order, its commitments and the processes behind them.
+    """
+    events.append(TimelineEvent(
         order,
         order.due_date,
         "",
         order.timeline_title(),
         "",
         order.description,
-    )
-    events['events'].append(te.dictify())
+    ))
     for pc in order.producing_commitments():
-        te = TimelineEvent(
+        events.append(TimelineEvent(
             pc,
             pc.due_date,
             "",
             pc.timeline_title(),
             pc.url,
             pc.description,
-        )
-        events['events'].append(te.dictify())
+        ))
         backschedule_process(order, pc.process, events)
+    return events
+
+def timeline_node_id(obj):
+    return "-".join([obj.__class__.__name__, str(obj.id)])
+
+def rebuild_timeline_entries(order):
+    """
+    Replaces the TimelineEntry rows of ``order`` with the events
+    backschedule_order finds now.
+    """
+    order.timeline_entries.all().delete()
+    entries = []
+    for position, event in enumerate(backschedule_order(order, [])):
+        entries.append(TimelineEntry(
+            order=order,
+            position=position,
+            node_id=timeline_node_id(event.node),
+            kind=event.node.__class__.__name__,
+            start=event.start,
+            end=event.end or None,
+            title=event.title,
+            link=event.link or "",
+            description=event.description or "",
+        ))
+    for batch in chunks(entries):
+        TimelineEntry.objects.bulk_create(batch)
+    touch_timeline(order.id)
+    return entries
+
+TIMELINE_STAMP_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"
+
+def touch_timeline(order_id):
+    """Stamps the timeline of ``order_id`` as changed now."""
+    now = timezone.now()
+    if not TimelineChange.objects.filter(order_id=order_id).update(changed=now):
+        TimelineChange(order_id=order_id, changed=now).save()
+
+def timeline_last_changed():
+    return TimelineChange.objects.aggregate(Max("changed"))["changed__max"]
+
+def timeline_stamp(changed):
+    if changed is None:
+        return None
+    return changed.astimezone(timezone.utc).strftime(TIMELINE_STAMP_FORMAT)
+
+def parse_timeline_stamp(stamp):
+    """Raises ValueError for a malformed stamp."""
+    return timezone.make_aware(
+        datetime.datetime.strptime(stamp, TIMELINE_STAMP_FORMAT), timezone.utc)
+
+def timeline_changed_orders(since):
+    """The ids of the orders whose timeline changed after ``since``."""
+    return TimelineChange.objects.filter(changed__gt=since).values_list("order_id", flat=True)
+
+timeline_state = threading.local()
+
+@contextmanager
+def timeline_deferred():
+    """
+    Collects the orders whose timeline changes in this thread and
+    rebuilds each once at the end, instead of on every save.
+    """
+    if hasattr(timeline_state, "order_ids"):
+        yield
+        return
+    timeline_state.order_ids = set()
+    try:
+        yield
+    finally:
+        order_ids = timeline_state.order_ids
+        del timeline_state.order_ids
+    update_timeline_entries(order_ids)
+
+def defers_timeline(func):
+    """Runs ``func`` in timeline_deferred, e.g. a view saving an order."""
+    def wrapper(*args, **kwargs):
+        with timeline_deferred():
+            return func(*args, **kwargs)
+    wrapper.__name__ = func.__name__
+    wrapper.__doc__ = func.__doc__
+    return wrapper
+
+def update_timeline_entries(order_ids):
+    order_ids = set(order_id for order_id in order_ids if order_id)
+    if hasattr(timeline_state, "order_ids"):
+        timeline_state.order_ids.update(order_ids)
+        return
+    for batch in chunks(order_ids):
+        for order in Order.objects.filter(id__in=batch):
+            rebuild_timeline_entries(order)
+
+TIMELINE_PAGE_SIZE = 50
+TIMELINE_MAX_PAGE_SIZE = 500
+
+def timeline_entries(start=None, end=None, order_id=None, agent_id=None, since=None):
+    """
+    The TimelineEntries overlapping ``start`` to ``end``, optionally
+    only those of ``order_id``, of the orders ``agent_id`` provides
+    or receives, or of the orders changed after ``since``,
+    in (start, id) order for timeline_page.
+    """
+    entries = TimelineEntry.objects.all()
+    if since:
+        entries = entries.filter(order__id__in=timeline_changed_orders(since))
+    if start:
+        entries = entries.filter(Q(end__gte=start) | Q(end=None, start__gte=start))
+    if end:
+        entries = entries.filter(start__lte=end)
+    if order_id:
+        entries = entries.filter(order__id=order_id)
+    if agent_id:
+        entries = entries.filter(Q(order__provider__id=agent_id) | Q(order__receiver__id=agent_id))
+    return entries.order_by("start", "id")
+
+def timeline_page(entries, cursor=None, size=TIMELINE_PAGE_SIZE):
+    """
+    One page of ``entries`` after ``cursor``, still a queryset so it
+    can be streamed, and the cursor of the next page (None on the last
+    one).  A cursor is the start date and id of the last entry of the
+    previous page, "YYYY-MM-DD.id", so pages stay put while entries
+    are added.
+    Raises ValueError for a malformed cursor.
+    """
+    if cursor:
+        start, entry_id = cursor.split(".")
+        start = datetime.datetime.strptime(start, "%Y-%m-%d").date()
+        entry_id = int(entry_id)
+        entries = entries.filter(Q(start__gt=start) | Q(start=start, id__gt=entry_id))
+    # the last entry of this page, if there is another after it
+    ends = list(entries.values_list("start", "id")[size - 1:size + 1])
+    next_cursor = None
+    if len(ends) > 1:
+        next_cursor = "%s.%s" % (ends[0][0].strftime("%Y-%m-%d"), ends[0][1])
+    return entries[:size], next_cursor
+
+TIMELINE_ROW_FIELDS = ("id", "order", "start", "end", "title", "link", "description")
+TIMELINE_BATCH_SIZE = 500
+
+def timeline_event_json(row):
+    """
+    The json of one timeline event from TIMELINE_ROW_FIELDS values,
+    with the keys of TimelineEvent.dictify plus the entry's id and order.
+    """
+    entry_id, order_id, start, end, title, link, description = row
+    parts = ['{"id": %d, "order": %d, "start": "%s", "title": %s, "description": %s' % (
+        entry_id, order_id, format_timeline_date(start),
+        encode_basestring_ascii(title), encode_basestring_ascii(description))]
+    if end:
+        parts.append(', "end": "%s", "durationEvent": true' % format_timeline_date(end))
+    else:
+        parts.append(', "durationEvent": false')
+    if link:
+        parts.append(', "link": %s' % encode_basestring_ascii(link))
+    parts.append("}")
+    return "".join(parts)
+
+def stream_timeline_json(rows, batch_size=TIMELINE_BATCH_SIZE, **extra):
+    """
+    Streams a timeline json document with the events of ``rows``
+    (TIMELINE_ROW_FIELDS tuples, e.g. from values_list().iterator())
+    and the ``extra`` keys, ``batch_size`` events per chunk, so it
+    never holds more than a batch in memory.
+    """
+    yield '{"dateTimeFormat": "Gregorian", "events": ['
+    batch = []
+    separator = ""
+    for row in rows:
+        batch.append(timeline_event_json(row))
+        if len(batch) >= batch_size:
+            yield separator + ", ".join(batch)
+            separator = ", "
+            batch = []
+    if batch:
+        yield separator + ", ".join(batch)
+    yield "]"
+    for key in sorted(extra):
+        yield ", %s: %s" % (encode_basestring_ascii(key), simplejson.dumps(extra[key]))
+    yield "}"
+
+class OrderPlan(object):
+    """
+    The processes and commitments exploded for ``order``, built in
+    memory and written by ``save`` in one transaction: slugs assigned
+    in a batch, commitments inserted with bulk_create.
+
+    Recipe lookups are cached per process and resource type, so a
+    component used all over the order costs no further queries.
+    Raises XbillCycleError if the recipe leads back to itself.
+    """
+    def __init__(self, order, user=None):
+        self.order = order
+        self.user = user
+        self.processes = []
+        self.commitments = []
+        self.inputs = {}
+        self.producers = {}
+
+    def consumed(self, process_type):
+        if not process_type.id in self.inputs:
+            self.inputs[process_type.id] = list(
+                process_type.consumed_resource_type_relationships().select_related(
+                    "resource_type", "relationship__event_type"))
+        return self.inputs[process_type.id]
+
+    def producer(self, resource_type):
+        if not resource_type.id in self.producers:
+            pptrs = resource_type.producing_process_type_relationships().select_related(
+                "process_type", "relationship__event_type")[:1]
+            self.producers[resource_type.id] = pptrs and pptrs[0] or None
+        return self.producers[resource_type.id]
+
+    def add_process(self, process_type, start_date, end_date, **kwargs):
+        process = Process(
+            name=process_type.name,
+            process_type=process_type,
+            project=process_type.project,
+            url=process_type.url,
+            end_date=end_date,
+            start_date=start_date,
+            **kwargs
+        )
+        self.processes.append(process)
+        return process
+
+    def add_commitment(self, **kwargs):
+        kwargs.setdefault("independent_demand", self.order)
+        kwargs.setdefault("created_by", self.user)
+        commitment = Commitment(**kwargs)
+        self.commitments.append(commitment)
+        return commitment
+
+    def explode(self, process, quantity):
+        """
+        Plans what ``process`` consumes to make ``quantity`` of its
+        output, and the processes producing that, all the way down.
+        """
+        stack = [(process, quantity, [process.process_type])]
+        while stack:
+            process, quantity, path = stack.pop()
+            pt = process.process_type
+            for ptrt in self.consumed(pt):
+                self.add_commitment(
+                    event_type=ptrt.relationship.event_type,
+                    relationship=ptrt.relationship,
+                    due_date=process.start_date,
+                    resource_type=ptrt.resource_type,
+                    process=process,
+                    project=pt.project,
+                    quantity=quantity * ptrt.quantity,
+                    unit_of_quantity=ptrt.resource_type.unit,
+                )
+                pptr = self.producer(ptrt.resource_type)
+                if pptr:
+                    next_pt = pptr.process_type
+                    check_xbill_cycle(path, next_pt)
+                    next_process = self.add_process(
+                        next_pt,
+                        process.start_date - datetime.timedelta(minutes=next_pt.estimated_duration),
+                        process.start_date,
+                    )
+                    next_commitment = self.add_commitment(
+                        event_type=pptr.relationship.event_type,
+                        relationship=pptr.relationship,
+                        due_date=process.start_date,
+                        resource_type=pptr.resource_type,
+                        process=next_process,
+                        project=next_pt.project,
+                        quantity=quantity * pptr.quantity,
+                        unit_of_quantity=pptr.resource_type.unit,
+                    )
+                    stack.append((next_process, next_commitment.quantity, path + [next_pt]))
+
+    def save(self):
+        """
+        Writes the plan, and rebuilds the order's timeline:
+        bulk_create sends no signals.
+        """
+        with transaction.commit_on_success():
+            self.write()
+        update_timeline_entries([self.order.id])
+
+    def write(self):
+        """
+        Writes the plan, in the caller's transaction.
+        """
+        batch_unique_slugify(self.processes,
+            [process.slug_value() for process in self.processes])
+        # One insert each, for their ids: bulk_create doesn't set them.
+        # Saved raw, as fixtures are, so Process.save doesn't probe
+        # for a slug again, and the timeline handlers don't look for
+        # commitments that aren't there yet.
+        for process in self.processes:
+            process.save_base(raw=True, force_insert=True)
+        for commitment in self.commitments:
+            if commitment.process and not commitment.process_id:
+                commitment.process_id = commitment.process.id
+        batch_unique_slugify(self.commitments,
+            [commitment.slug_value() for commitment in self.commitments])
+        for batch in chunks(self.commitments):
+            Commitment.objects.bulk_create(batch)
 
 def generate_schedule(process, order, user):
-    pt = process.process_type
-    output = process.main_outgoing_commitment()
-    for ptrt in pt.consumed_resource_type_relationships():
-        commitment = Commitment(
-            independent_demand=order,
-            event_type=ptrt.relationship.event_type,
-            relationship=ptrt.relationship,
+    plan = OrderPlan(order, user)
+    plan.explode(process, process.main_outgoing_commitment().quantity)
+    plan.save()
+
+def plan_order_line(plan, line):
+    """
+    Adds one line of ``plan``'s order to it: the process making the
+    line's resource type, the chosen options, and their explosions.
+    ``line`` is a dict of resource_type (id), quantity, description
+    and options (Option ids), as queued by create_order.
+    """
+    order = plan.order
+    rt = EconomicResourceType.objects.get(id=line["resource_type"])
+    qty = Decimal(line["quantity"])
+    pt = rt.main_producing_process_type()
+    ptrt = rt.main_producing_process_type_relationship()
+    start_date = order.due_date - datetime.timedelta(minutes=pt.estimated_duration)
+    process = plan.add_process(
+        pt,
+        start_date,
+        order.due_date,
+        owner=order.provider,
+        managed_by=order.provider,
+    )
+    plan.add_commitment(
+        order=order,
+        event_type=ptrt.relationship.event_type,
+        relationship=ptrt.relationship,
+        due_date=order.due_date,
+        from_agent_type=order.provider.agent_type,
+        from_agent=order.provider,
+        to_agent=order.receiver,
+        resource_type=rt,
+        process=process,
+        project=pt.project,
+        description=line["description"],
+        quantity=qty,
+        unit_of_quantity=rt.unit,
+    )
+    options = Option.objects.filter(id__in=line["options"]).select_related(
+        "component", "feature__relationship__event_type")
+    for option in options:
+        component = option.component
+        feature = option.feature
+        if feature.process_type_id != pt.id:
+            raise ValueError(feature.process_type)
+        plan.add_commitment(
+            event_type=feature.relationship.event_type,
+            relationship=feature.relationship,
             due_date=process.start_date,
-            resource_type=ptrt.resource_type,
+            to_agent=order.provider,
+            resource_type=component,
             process=process,
             project=pt.project,
-            quantity=output.quantity * ptrt.quantity,
-            unit_of_quantity=ptrt.resource_type.unit,
-            created_by=user,
+            quantity=qty * feature.quantity,
+            unit_of_quantity=component.unit,
         )
-        commitment.save()
-        pptr = ptrt.resource_type.main_producing_process_type_relationship()
+        pptr = plan.producer(component)
         if pptr:
             next_pt = pptr.process_type
             start_date = process.start_date - datetime.timedelta(minutes=next_pt.estimated_duration)
-            next_process = Process(          
-                name=next_pt.name,
-                process_type=next_pt,
-                project=next_pt.project,
-                url=next_pt.url,
-                end_date=process.start_date,
-                start_date=start_date,
+            next_process = plan.add_process(
+                next_pt,
+                start_date,
+                process.start_date,
             )
-            next_process.save()
-            next_commitment = Commitment(
-                independent_demand=order,
+            plan.add_commitment(
                 event_type=pptr.relationship.event_type,
                 relationship=pptr.relationship,
                 due_date=process.start_date,
                 resource_type=pptr.resource_type,
                 process=next_process,
                 project=next_pt.project,
-                quantity=output.quantity * pptr.quantity,
+                quantity=qty * feature.quantity,
                 unit_of_quantity=pptr.resource_type.unit,
-                created_by=user,
             )
-            next_commitment.save()
-            generate_schedule(next_process, order, user)
+            plan.explode(next_process, qty * feature.quantity)
+    plan.explode(process, qty)
+    return process
+
+def queue_order_explosion(order, lines, user=None):
+    """
+    Queues an OrderJob for the explode_orders worker to plan
+    ``lines``, as for plan_order_line, for ``order``.
+    """
+    return OrderJob.objects.create(
+        order=order,
+        lines=simplejson.dumps(lines),
+        total=len(lines),
+        created_by=user,
+    )
+
+# seconds after which a running job is taken to have lost its worker,
+# and can be claimed again
+ORDER_JOB_TIMEOUT = getattr(settings, "ORDER_JOB_TIMEOUT", 30 * 60)
+
+class OrderJobReclaimed(Exception):
+    """
+    Raised when another worker claimed the job being run, after
+    ORDER_JOB_TIMEOUT, so this run's plan must not be saved.
+    """
+
+def claim_order_job(timeout=ORDER_JOB_TIMEOUT):
+    """
+    The oldest pending OrderJob, or running one started more than
+    ``timeout`` seconds ago, now marked running, or None.
+    A job goes to the one worker whose update changes its status and
+    start, so several workers can share the queue.
+    """
+    now = timezone.now()
+    claimable = OrderJob.objects.filter(Q(status="pending") |
+        Q(status="running", started__lt=now - datetime.timedelta(seconds=timeout)))
+    for job_id, status, started in claimable.order_by("created", "id").values_list(
+            "id", "status", "started")[:10]:
+        claimed = OrderJob.objects.filter(id=job_id, status=status, started=started).update(
+            status="running", started=now, progress=0)
+        if claimed:
+            return OrderJob.objects.select_related("order").get(id=job_id)
+    return None
+
+def order_job_stale(job, timeout=ORDER_JOB_TIMEOUT):
+    """
+    Whether ``job`` has been running so long its worker must have died.
+    """
+    return job.status == "running" and job.started is not None and \
+        job.started < timezone.now() - datetime.timedelta(seconds=timeout)
+
+def requeue_order_jobs():
+    """
+    Puts every running OrderJob back in the queue, e.g. after all
+    the workers died.  Returns how many.
+    """
+    return OrderJob.objects.filter(status="running").update(
+        status="pending", started=None, progress=0)
+
+def run_order_job(job):
+    """
+    Plans the lines of ``job``, counting them off in its progress, and
+    saves the plan.  If anything fails the job is marked failed with
+    the error, and nothing of the plan is saved.  If another worker
+    reclaimed the job meanwhile, nothing is saved either, and the job
+    is left to it.
+    """
+    mine = OrderJob.objects.filter(id=job.id, status="running", started=job.started)
+    plan = OrderPlan(job.order, job.created_by)
+    try:
+        for i, line in enumerate(simplejson.loads(job.lines)):
+            plan_order_line(plan, line)
+            job.progress = i + 1
+            if not mine.update(progress=job.progress):
+                raise OrderJobReclaimed()
+        job.status = "done"
+        job.finished = timezone.now()
+        with transaction.commit_on_success():
+            plan.write()
+            # the plan and the job's end go together
+            if not mine.update(status=job.status, finished=job.finished):
+                raise OrderJobReclaimed()
+    except OrderJobReclaimed:
+        return OrderJob.objects.get(id=job.id)
+    except Exception, e:
+        job.status = "failed"
+        job.error = "%s: %s" % (e.__class__.__name__, e)
+        job.finished = timezone.now()
+        mine.update(status=job.status, error=job.error, finished=job.finished)
+        return job
+    update_timeline_entries([job.order_id])
+    return job
+
+CAPACITY_HORIZON = getattr(settings, "CAPACITY_HORIZON", 730)
+
+class CapacitySchedule(object):
+    """
+    Finite capacity schedule of the processes of ``orders`` (by default
+    the orders due from ``start`` on), from ``start`` (today) on.
+
+    Each process takes its process type's estimated duration in whole
+    days, and its work commitments take hours of their type of work:
+    from their agent's capacity on that type of work if assigned,
+    from all the capable agents' capacity if not.  Capacity is the
+    hours per day of the work-type AgentResourceTypes; work nobody
+    has capacity for is not limited.  A process whose work does not
+    fit one agent's days is stretched over more days.
+
+    ``backward`` finds each process's latest start from its order's
+    due date, ignoring capacity; ``forward`` then places processes
+    from a priority queue, least latest start first, each as early as
+    its inputs and the booked hours per day allow.  ``save`` writes
+    the dates back with a few bulk updates.
+    """
+    def __init__(self, orders=None, start=None, horizon=CAPACITY_HORIZON):
+        self.start = start or datetime.date.today()
+        self.horizon = horizon
+        if orders is None:
+            orders = Order.objects.filter(due_date__gte=self.start)
+        self.order_due = dict(orders.values_list("id", "due_date"))
+        self.processes = {}
+        self.preds = {}
+        self.capacity = {}
+        self.booked = {}
+        # the first day each resource has hours left, to skip full days
+        self.first_open = {}
+        self.latest_start = {}
+        self.placed = {}
+        self.overloaded = set()
+        self.load_capacity()
+        self.load()
+
+    def load_capacity(self):
+        arts = AgentResourceType.objects.filter(
+            resource_type__materiality="work").values_list(
+            "agent", "resource_type", "capacity")
+        for agent_id, rt_id, capacity in arts:
+            capacity = float(capacity or 0)
+            key = ("agent", agent_id, rt_id)
+            self.capacity[key] = self.capacity.get(key, 0.0) + capacity
+            self.capacity[("pool", rt_id)] = self.capacity.get(("pool", rt_id), 0.0) + capacity
+
+    def load(self):
+        producers = {}
+        for ids in chunks(self.order_due):
+            rows = Commitment.objects.filter(
+                independent_demand__id__in=ids).exclude(process=None).values_list(
+                "id", "process", "independent_demand", "resource_type",
+                "resource_type__materiality", "relationship__direction",
+                "from_agent", "quantity")
+            for commitment_id, process_id, order_id, rt_id, materiality, direction, agent_id, quantity in rows:
+                process = self.processes.setdefault(process_id, {
+                    "order": order_id,
+                    "inputs": [],
+                    "outputs": [],
+                    "work": [],
+                })
+                if direction == "out":
+                    process["outputs"].append(commitment_id)
+                    producers.setdefault((order_id, rt_id), set()).add(process_id)
+                else:
+                    process["inputs"].append(commitment_id)
+                    process.setdefault("needs", []).append((order_id, rt_id))
+                    if materiality == "work":
+                        process["work"].append((rt_id, agent_id, float(quantity)))
+        for ids in chunks(self.processes):
+            rows = Process.objects.filter(id__in=ids).values_list(
+                "id", "start_date", "end_date", "process_type__estimated_duration")
+            for process_id, start_date, end_date, minutes in rows:
+                if minutes:
+                    days = int(math.ceil(minutes / 1440.0))
+                elif end_date:
+                    days = (end_date - start_date).days
+                else:
+                    days = 1
+                self.processes[process_id]["days"] = max(days, 1)
+        for process_id, process in self.processes.iteritems():
+            preds = set()
+            for need in process.get("needs", []):
+                preds.update(producers.get(need, []))
+            preds.discard(process_id)
+            self.preds[process_id] = preds
+
+    def topological_order(self):
+        """
+        Producers before consumers (Kahn's algorithm); processes on a
+        cycle, which a sane schedule can't have, come last.
+        """
+        succs = dict((process_id, []) for process_id in self.processes)
+        waiting = {}
+        for process_id, preds in self.preds.iteritems():
+            waiting[process_id] = len(preds)
+            for pred in preds:
+                succs[pred].append(process_id)
+        ready = sorted(process_id for process_id, count in waiting.iteritems() if not count)
+        order = []
+        while ready:
+            process_id = ready.pop()
+            order.append(process_id)
+            for succ in succs[process_id]:
+                waiting[succ] -= 1
+                if not waiting[succ]:
+                    ready.append(succ)
+        seen = set(order)
+        order.extend(sorted(process_id for process_id in self.processes if not process_id in seen))
+        return order, succs
+
+    def backward(self):
+        order, succs = self.topological_order()
+        for process_id in reversed(order):
+            process = self.processes[process_id]
+            end = self.order_due[process["order"]]
+            for succ in succs[process_id]:
+                if succ in self.latest_start and self.latest_start[succ] < end:
+                    end = self.latest_start[succ]
+            self.latest_start[process_id] = end - datetime.timedelta(days=process["days"])
+        return self.latest_start
+
+    def demands(self, process):
+        """
+        (resource keys, hours per day, days) of ``process``'s work,
+        stretched so no key needs more than its capacity on one day.
+        """
+        days = process["days"]
+        hours = {}
+        for rt_id, agent_id, quantity in process["work"]:
+            keys = [("pool", rt_id)]
+            if agent_id and ("agent", agent_id, rt_id) in self.capacity:
+                keys.append(("agent", agent_id, rt_id))
+            for key in keys:
+                if self.capacity.get(key):
+                    hours[key] = hours.get(key, 0.0) + quantity
+        for key, total in hours.iteritems():
+            days = max(days, int(math.ceil(total / self.capacity[key] - 1e-9)))
+        return [(key, total / days) for key, total in hours.iteritems()], days
+
+    def fits(self, demands, start, days):
+        """
+        The first day from ``start`` on which ``demands`` overflow
+        their capacity, or None if the ``days`` from ``start`` fit.
+        """
+        for offset in range(days):
+            day = start + offset
+            for key, per_day in demands:
+                if self.booked.get(key, {}).get(day, 0.0) + per_day > self.capacity[key] + 1e-9:
+                    return day
+        return None
+
+    def forward(self):
+        if not self.latest_start:
+            self.backward()
+        first = self.start.toordinal()
+        waiting = dict((process_id, len(preds)) for process_id, preds in self.preds.iteritems())
+        order, succs = self.topological_order()
+        earliest = dict((process_id, first) for process_id in self.processes)
+        queue = []
+        for process_id in order:
+            if not waiting[process_id]:
+                heapq.heappush(queue, (self.latest_start[process_id], process_id))
+        placed = set()
+        while queue or len(placed) < len(self.processes):
+            if not queue:
+                # what is left waits on a cycle: place it anyway
+                process_id = [pid for pid in order if not pid in placed][0]
+            else:
+                latest, process_id = heapq.heappop(queue)
+                if process_id in placed:
+                    continue
+            placed.add(process_id)
+            process = self.processes[process_id]
+            demands, days = self.demands(process)
+            start = earliest[process_id]
+            for key, per_day in demands:
+                start = max(start, self.first_open.get(key, first))
+            while True:
+                clash = self.fits(demands, start, days)
+                if clash is None:
+                    break
+                start = clash + 1
+                if start > first + self.horizon:
+                    start = earliest[process_id]
+                    self.overloaded.add(process_id)
+                    break
+            for key, per_day in demands:
+                booked = self.booked.setdefault(key, {})
+                for day in range(start, start + days):
+                    booked[day] = booked.get(day, 0.0) + per_day
+                day = self.first_open.get(key, first)
+                while booked.get(day, 0.0) >= self.capacity[key] - 1e-9:
+                    day += 1
+                self.first_open[key] = day
+            end = start + days
+            self.placed[process_id] = (
+                datetime.date.fromordinal(start), datetime.date.fromordinal(end))
+            for succ in succs[process_id]:
+                earliest[succ] = max(earliest[succ], end)
+                waiting[succ] -= 1
+                if not waiting[succ]:
+                    heapq.heappush(queue, (self.latest_start[succ], succ))
+        return self.placed
+
+    def late(self):
+        """The placed processes ending after their order is due."""
+        return [process_id for process_id, (start, end) in self.placed.iteritems()
+            if end > self.order_due[self.processes[process_id]["order"]]]
+
+    def save(self):
+        """
+        Writes the placed dates back, one update per distinct date
+        (pair): a process's input commitments are due when it starts,
+        its outputs when it ends.
+        """
+        by_dates = {}
+        due = {}
+        for process_id, (start, end) in self.placed.iteritems():
+            by_dates.setdefault((start, end), []).append(process_id)
+            process = self.processes[process_id]
+            due.setdefault(start, []).extend(process["inputs"])
+            due.setdefault(end, []).extend(process["outputs"])
+        for (start, end), process_ids in by_dates.iteritems():
+            for ids in chunks(process_ids):
+                Process.objects.filter(id__in=ids).update(start_date=start, end_date=end)
+        for due_date, commitment_ids in due.iteritems():
+            for ids in chunks(commitment_ids):
+                Commitment.objects.filter(id__in=ids).update(due_date=due_date)
+        # updates send no signals
+        update_timeline_entries(set(
+            self.processes[process_id]["order"] for process_id in self.placed))
+        return len(self.placed)
+
+
+class CriticalPath(object):
+    """
+    Critical path of ``order``'s processes: early and late start and
+    finish, slack in days, and the driving chain of processes that
+    decides when the order is done.
+
+    One query loads all the order's commitments with their processes;
+    a process depends on the processes producing the resource types
+    it consumes.  Early dates run forward from the order's first
+    scheduled process, late dates backward from its due date, both
+    in one pass over the processes in topological order.  Processes
+    with the least slack (negative if the order will be late) are
+    critical.
+    """
+    def __init__(self, order):
+        self.order = order
+        self.processes = {}
+        self.commitments = {}
+        self.preds = {}
+        self.rows = []
+        self.chain = []
+        self.load()
+        self.compute()
+
+    def load(self):
+        commitments = Commitment.objects.filter(
+            Q(independent_demand=self.order) | Q(order=self.order)).exclude(
+            process=None).select_related(
+            "process__process_type", "resource_type", "relationship")
+        producers = {}
+        needs = {}
+        for commitment in commitments:
+            self.processes.setdefault(commitment.process_id, commitment.process)
+            self.commitments.setdefault(commitment.process_id, []).append(commitment)
+            if commitment.relationship and commitment.relationship.direction == "out":
+                producers.setdefault(commitment.resource_type_id, set()).add(commitment.process_id)
+            else:
+                needs.setdefault(commitment.process_id, set()).add(commitment.resource_type_id)
+        for process_id in self.processes:
+            preds = set()
+            for rt_id in needs.get(process_id, []):
+                preds.update(producers.get(rt_id, []))
+            preds.discard(process_id)
+            self.preds[process_id] = preds
+
+    def duration(self, process):
+        if process.end_date:
+            return max((process.end_date - process.start_date).days, 0)
+        minutes = process.process_type and process.process_type.estimated_duration
+        return max(int(math.ceil((minutes or 0) / 1440.0)), 1)
+
+    def compute(self):
+        if not self.processes:
+            return
+        succs = dict((process_id, []) for process_id in self.processes)
+        waiting = {}
+        for process_id, preds in self.preds.iteritems():
+            waiting[process_id] = len(preds)
+            for pred in preds:
+                succs[pred].append(process_id)
+        ready = sorted(process_id for process_id, count in waiting.iteritems() if not count)
+        order = []
+        while ready:
+            process_id = ready.pop()
+            order.append(process_id)
+            for succ in succs[process_id]:
+                waiting[succ] -= 1
+                if not waiting[succ]:
+                    ready.append(succ)
+        # processes on a cycle can't be ordered: leave them out
+        if not order:
+            return
+        start = min(process.start_date for process in self.processes.values())
+        early = {}
+        for process_id in order:
+            es = start
+            for pred in self.preds[process_id]:
+                if pred in early and early[pred][1] > es:
+                    es = early[pred][1]
+            days = datetime.timedelta(days=self.duration(self.processes[process_id]))
+            early[process_id] = (es, es + days)
+        late = {}
+        for process_id in reversed(order):
+            lf = self.order.due_date
+            for succ in succs[process_id]:
+                if succ in late and late[succ][0] < lf:
+                    lf = late[succ][0]
+            days = datetime.timedelta(days=self.duration(self.processes[process_id]))
+            late[process_id] = (lf - days, lf)
+        slack = dict((process_id, (late[process_id][0] - early[process_id][0]).days)
+            for process_id in order)
+        self.min_slack = min(slack.values())
+        self.finish = max(ef for es, ef in early.values())
+        for process_id in order:
+            self.rows.append({
+                "process": self.processes[process_id],
+                "early_start": early[process_id][0],
+                "early_finish": early[process_id][1],
+                "late_start": late[process_id][0],
+                "late_finish": late[process_id][1],
+                "slack": slack[process_id],
+                "critical": slack[process_id] == self.min_slack,
+                "commitments": self.commitments[process_id],
+            })
+        self.rows.sort(key=lambda row: (row["early_start"], row["process"].id))
+        # back from the last finish, through the predecessor that drives each start
+        process_id = max(order, key=lambda process_id: (early[process_id][1], -slack[process_id]))
+        while process_id is not None:
+            self.chain.append(self.processes[process_id])
+            drivers = [pred for pred in self.preds[process_id]
+                if pred in early and early[pred][1] == early[process_id][0]]
+            process_id = drivers and min(drivers, key=lambda pred: slack[pred]) or None
+        self.chain.reverse()
+
+    def dictify(self):
+        def date(value):
+            return value.strftime("%Y-%m-%d")
+        return {
+            "order": self.order.id,
+            "due_date": date(self.order.due_date),
+            "finish": self.rows and date(self.finish) or None,
+            "processes": [{
+                "id": row["process"].id,
+                "name": row["process"].name,
+                "early_start": date(row["early_start"]),
+                "early_finish": date(row["early_finish"]),
+                "late_start": date(row["late_start"]),
+                "late_finish": date(row["late_finish"]),
+                "slack": row["slack"],
+                "critical": row["critical"],
+                "commitments": [commitment.id for commitment in row["commitments"]],
+            } for row in self.rows],
+            "driving_chain": [process.id for process in self.chain],
+        }
+
 
 class XbillNode(object):
     def __init__(self, node, depth):
@@ -244,6 +1801,7 @@ class XbillNode(object):
          self.depth = depth
          self.open = False
          self.close = []
+         self.show = True
          self.xbill_class = self.node.xbill_class()
 
     def xbill_object(self):
@@ -262,43 +1820,853 @@ class XbillNode(object):
     def category(self):
         return self.node.xbill_category()
 
+    def dictify(self):
+        xbill_object = self.xbill_object()
+        d = {
+            "node_id": self.node.node_id(),
+            "depth": self.depth,
+            "explanation": self.xbill_explanation(),
+            "label": self.xbill_label(),
+            "name": unicode(xbill_object),
+            "class": self.xbill_class,
+            "expandable": getattr(self, "expandable", False),
+        }
+        url = getattr(xbill_object, "url", "")
+        if url:
+            d["url"] = url
+        description = getattr(xbill_object, "description", "")
+        if description:
+            d["description"] = description
+        return d
+
 
-def xbill_dfs(node, all_nodes, depth):
+def xbill_dfs(node, children, depth, depth_limit=None, categories=None, path=None):
     """
-    Performs a recursive depth-first search starting at ``node``. 
+    Performs a recursive depth-first search starting at ``node``.
+
+    ``children`` is a parent -> children index, keyed by the
+    ``node_id()`` of each node's xbill parent object, such as an
+    XbillGraph's ``children``, so each node is visited once.
+    The search stops below ``depth_limit``.  With ``categories``, nodes
+    of other categories are hidden, and dropped unless they lead to a
+    node that shows.
+    ``path`` holds the xbill objects above ``node``; a node leading
+    back to one of them raises XbillCycleError.
     """
-    to_return = [XbillNode(node,depth),]
-    #print "+created node:+", node, depth
-    #import pdb; pdb.set_trace()
-    for subnode in all_nodes:
-        parents = subnode.xbill_parent_object().xbill_parents()
-        if not subnode is node:
-            if parents and node in parents:
-                #print "*active node:*", node, "*depth:*", depth, "*subnode:*", subnode, "*parent_object:*", subnode.xbill_parent_object(), "*parents:*", parents
-                #import pdb; pdb.set_trace()
-                to_return.extend(xbill_dfs(subnode, all_nodes, depth+1))
+    if path is None:
+        path = [node.xbill_parent_object()]
+    xbill_object = node.xbill_child_object()
+    check_xbill_cycle(path, xbill_object)
+    xbill_node = XbillNode(node,depth)
+    if categories:
+        category = xbill_node.category()
+        xbill_node.show = category is not None and category.name in categories
+    to_return = [xbill_node,]
+    if depth_limit is None or depth < depth_limit:
+        path.append(xbill_object)
+        for subnode in children.get(xbill_object.node_id(), []):
+            if not subnode is node:
+                to_return.extend(xbill_dfs(subnode, children, depth+1, depth_limit, categories, path))
+        path.pop()
+    if len(to_return) == 1 and not xbill_node.show:
+        return []
     return to_return
 
-def explode_xbill_children(node, nodes):
-    nodes.append(node)
-    #import pdb; pdb.set_trace()
-    for kid in node.xbill_child_object().xbill_children():
-        explode_xbill_children(kid, nodes)
+def chunks(items, size=500):
+    """
+    Splits ``items`` into lists short enough for one ``__in`` lookup
+    or ``bulk_create`` (sqlite refuses more than 999 query parameters).
+    """
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i+size]
+
+# select_related arguments that let an xbill node render without queries
+XBILL_NODE_MODELS = {
+    "ProcessResource": (ProcessTypeResourceType, ('process_type',
+        'resource_type', 'relationship', 'unit_of_quantity',
+        'resource_type__category')),
+    "AgentResource": (AgentResourceType, ('agent', 'resource_type',
+        'relationship')),
+    "Feature": (Feature, ('process_type', 'product', 'relationship',
+        'unit_of_quantity')),
+    "Option": (Option, ('feature', 'component', 'component__category')),
+}
+
+def xbill_related(model):
+    for m, related in XBILL_NODE_MODELS.values():
+        if m is model:
+            return related
+
+def xbill_nodes_by_id(node_ids):
+    """
+    Fetches the xbill nodes named by ``node_ids`` (as returned by
+    their ``node_id()`` methods) with one query per kind of node.
+    Returns a dict keyed by node id.
+    """
+    pks = {}
+    for node_id in node_ids:
+        kind, pk = node_id.rsplit("-", 1)
+        pks.setdefault(kind, []).append(int(pk))
+    nodes = {}
+    for kind, ids in pks.items():
+        model, related = XBILL_NODE_MODELS[kind]
+        for batch in chunks(ids):
+            for node in model.objects.filter(id__in=batch).select_related(*related):
+                nodes[node.node_id()] = node
+    return nodes
+
+
+class XbillGraph(object):
+    """
+    In-memory recipe graph for the extended bill of ``resource_type``.
+
+    Every ProcessTypeResourceType, AgentResourceType, Feature and Option
+    reachable from the resource type is fetched breadth-first, with one
+    query per relationship kind per level, and kept in a parent -> children
+    index keyed by node id, so ``xbill_dfs`` and ``xbill_children``
+    answer from memory instead of querying.  A component used in many
+    places is expanded once, and loading stops where a recipe cycle
+    closes; ``xbill_dfs`` reports the cycle as XbillCycleError.
+
+    With ``depth_limit``, nodes deeper than that are not loaded, and
+    ``prune`` stops the loading below some resource types (see ``load``).
+    Without ``resource_type`` the graph starts empty, to be filled
+    with ``load`` or ``load_level``.
+    """
+    def __init__(self, resource_type=None, depth_limit=None, prune=None):
+        self.resource_type = resource_type
+        self.depth_limit = depth_limit
+        self.children = {}
+        self.nodes = []
+        if resource_type:
+            self.load(prune=prune)
+
+    def add_child(self, node):
+        parent = node.xbill_parent_object().node_id()
+        self.children.setdefault(parent, []).append(node)
+        self.nodes.append(node)
+
+    def load(self, child_ids=None, prune=None):
+        """
+        Loads everything below the resource type, or below the xbill
+        objects named by ``child_ids`` (as returned by their
+        ``node_id()`` methods) if given.
+        ``prune``, if given, is called with the ids of each level's new
+        resource types and returns those not to load below.
+        """
+        rt_ids = set()
+        pt_ids = set()
+        feature_ids = set()
+        if child_ids is None:
+            rt_ids.add(self.resource_type.id)
+        for child_id in child_ids or []:
+            kind, pk = child_id.rsplit("-", 1)
+            if kind == "ResourceType":
+                rt_ids.add(int(pk))
+            elif kind == "ProcessType":
+                pt_ids.add(int(pk))
+            elif kind == "Feature":
+                feature_ids.add(int(pk))
+        seen_rts = set()
+        seen_pts = set()
+        seen_features = set()
+        depth = 1
+        while rt_ids or pt_ids or feature_ids:
+            if self.depth_limit is not None and depth > self.depth_limit:
+                break
+            seen_rts.update(rt_ids)
+            seen_pts.update(pt_ids)
+            seen_features.update(feature_ids)
+            next_rts, next_pts, next_features = self.load_level(
+                rt_ids, pt_ids, feature_ids)
+            rt_ids = next_rts - seen_rts
+            if prune and rt_ids:
+                seen_rts.update(rt_ids)
+                rt_ids -= prune(rt_ids)
+            pt_ids = next_pts - seen_pts
+            feature_ids = next_features - seen_features
+            depth += 1
+
+    def load_level(self, rt_ids, pt_ids, feature_ids):
+        """
+        Loads the children of the given resource types, process types
+        and features, and returns the ids of the resource types,
+        process types and features below them.
+        """
+        next_rts = set()
+        next_pts = set()
+        next_features = set()
+        producers = []
+        distributors = []
+        for ids in chunks(rt_ids):
+            ptrts = ProcessTypeResourceType.objects.filter(
+                resource_type__id__in=ids,
+                relationship__direction='out').select_related(
+                *xbill_related(ProcessTypeResourceType))
+            for ptrt in ptrts:
+                self.add_child(ptrt)
+                next_pts.add(ptrt.process_type_id)
+            arts = AgentResourceType.objects.filter(
+                resource_type__id__in=ids).filter(
+                Q(relationship__direction='out') |
+                Q(relationship__name='distributes')).select_related(
+                *xbill_related(AgentResourceType))
+            for art in arts:
+                #todo: hack based on name 'distributes', see
+                # EconomicResourceType.distributor_relationships
+                if art.relationship.name == 'distributes':
+                    distributors.append(art)
+                else:
+                    producers.append(art)
+        # same order as EconomicResourceType.xbill_children
+        for art in producers + distributors:
+            self.add_child(art)
+        for ids in chunks(pt_ids):
+            ptrts = ProcessTypeResourceType.objects.filter(
+                process_type__id__in=ids,
+                relationship__direction='in').select_related(
+                *xbill_related(ProcessTypeResourceType))
+            for ptrt in ptrts:
+                self.add_child(ptrt)
+                next_rts.add(ptrt.resource_type_id)
+        features = []
+        for ids in chunks(pt_ids):
+            features.extend(Feature.objects.filter(
+                process_type__id__in=ids).select_related(
+                *xbill_related(Feature)))
+        for feature in features:
+            self.add_child(feature)
+            next_features.add(feature.id)
+        for ids in chunks(feature_ids):
+            options = Option.objects.filter(
+                feature__id__in=ids).select_related(
+                *xbill_related(Option))
+            for option in options:
+                self.add_child(option)
+                next_rts.add(option.component_id)
+        return next_rts, next_pts, next_features
+
+    def xbill_children(self, xbill_object):
+        return self.children.get(xbill_object.node_id(), [])
+
 
-def generate_xbill(resource_type):
+XBILL_LAZY_NODES = getattr(settings, "XBILL_LAZY_NODES", 500)
+
+def xbill_size(resource_type):
+    """
+    Returns the number of nodes and the depth of the extended bill of
+    ``resource_type``, from its closure rows.
+    """
+    size = XbillClosure.objects.filter(ancestor=resource_type).aggregate(
+        Count("id"), Max("depth"))
+    return size["id__count"], size["depth__max"] or 0
+
+def lazy_xbill(resource_type):
+    """
+    The first level of the extended bill of ``resource_type``, for
+    pages that fetch the rest with xbill_expand as nodes are opened.
+    Each node is marked ``expandable`` if it has children.
+    """
+    graph = XbillGraph(resource_type, 2)
+    nodes = []
+    for kid in graph.xbill_children(resource_type):
+        xbill_node = XbillNode(kid, 1)
+        xbill_node.expandable = bool(graph.xbill_children(kid.xbill_child_object()))
+        nodes.append(xbill_node)
+    annotate_tree_properties(nodes)
+    return nodes
+
+def xbill_expand(node_id, depth=1):
+    """
+    One level of xbill children below the node named by ``node_id``
+    (as returned by its ``node_id()`` method, or the ``node_id()`` of
+    a resource type for the top level), as XbillNodes at ``depth``,
+    marked ``expandable`` like lazy_xbill's.
+    Returns None if there is no such node.
+    """
+    try:
+        kind, pk = node_id.rsplit("-", 1)
+        pk = int(pk)
+    except ValueError:
+        return None
+    if kind in XBILL_NODE_MODELS:
+        node = xbill_nodes_by_id([node_id]).get(node_id)
+        if not node:
+            return None
+        xbill_object = node.xbill_child_object()
+    elif kind == "ResourceType":
+        try:
+            xbill_object = EconomicResourceType.objects.get(pk=pk)
+        except EconomicResourceType.DoesNotExist:
+            return None
+    else:
+        return None
+    rt_ids = set()
+    pt_ids = set()
+    feature_ids = set()
+    if isinstance(xbill_object, EconomicResourceType):
+        rt_ids.add(xbill_object.id)
+    elif isinstance(xbill_object, ProcessType):
+        pt_ids.add(xbill_object.id)
+    elif isinstance(xbill_object, Feature):
+        feature_ids.add(xbill_object.id)
+    graph = XbillGraph()
+    graph.load_level(*graph.load_level(rt_ids, pt_ids, feature_ids))
     nodes = []
-    for kid in resource_type.xbill_children():
-        explode_xbill_children(kid, nodes)
-    nodes = list(set(nodes))
-    #import pdb; pdb.set_trace()
+    for kid in graph.xbill_children(xbill_object):
+        xbill_node = XbillNode(kid, depth)
+        xbill_node.expandable = bool(graph.xbill_children(kid.xbill_child_object()))
+        nodes.append(xbill_node)
+    return nodes
+
+def generate_xbill(resource_type, depth_limit=None, categories=None):
+    """
+    Builds the extended bill of ``resource_type``, down to
+    ``depth_limit`` and showing only nodes of ``categories`` (by name)
+    if given.  See xbill_dfs.
+    """
+    graph = XbillGraph(resource_type, depth_limit)
     to_return = []
-    for kid in resource_type.xbill_children():
-        to_return.extend(xbill_dfs(kid, nodes, 1))
+    for kid in graph.xbill_children(resource_type):
+        to_return.extend(xbill_dfs(kid, graph.children, 1, depth_limit, categories, [resource_type]))
     annotate_tree_properties(to_return)
-    #to_return.sort(lambda x, y: cmp(x.xbill_object().name,
-    #                                y.xbill_object().name))
     return to_return
 
+def closure_xbill(resource_type):
+    """
+    Reads the extended bill of ``resource_type`` back from the
+    XbillClosure table: one indexed query for the paths plus one per
+    kind of node.  Falls back to generate_xbill while the closure has
+    not been built.
+    """
+    rows = XbillClosure.objects.filter(ancestor=resource_type).order_by(
+        'path').values_list('node_id', 'depth')
+    nodes = xbill_nodes_by_id(set(node_id for node_id, depth in rows))
+    to_return = []
+    path = [resource_type]
+    for node_id, depth in rows:
+        if not node_id in nodes:
+            return generate_xbill(resource_type)
+        node = nodes[node_id]
+        # the closure stops at a cycle, see explode_xbill_closure
+        del path[depth:]
+        check_xbill_cycle(path, node.xbill_child_object())
+        path.append(node.xbill_child_object())
+        to_return.append(XbillNode(node, depth))
+    if not to_return:
+        return generate_xbill(resource_type)
+    annotate_tree_properties(to_return)
+    return to_return
+
+# Each level of a closure path takes 5 characters of the 255 in
+# XbillClosure.path, and a sibling index 4 digits.
+XBILL_CLOSURE_MAX_DEPTH = 51
+XBILL_CLOSURE_MAX_SIBLINGS = 10000
+
+class XbillClosureLimitError(ValueError):
+    """
+    Raised when a bill is too deep or too wide for XbillClosure paths,
+    see XBILL_CLOSURE_MAX_DEPTH and XBILL_CLOSURE_MAX_SIBLINGS.
+    """
+
+def explode_xbill_closure(node, children, ancestor_id, depth, path, quantity, rows, above):
+    """
+    Appends the XbillClosure rows of ``node`` and everything below it
+    to ``rows``.  ``above`` holds the node ids of the xbill objects
+    above ``node``; a node leading back to one of them gets its row
+    but is not exploded, so a recipe cycle is stored up to the point
+    where it closes and closure_xbill can report it.
+    Raises XbillClosureLimitError past the closure's limits.
+    """
+    if depth > XBILL_CLOSURE_MAX_DEPTH:
+        raise XbillClosureLimitError("Bill deeper than %s levels" % XBILL_CLOSURE_MAX_DEPTH)
+    quantity = quantity * node.xbill_quantity()
+    child_id = node.xbill_child_object().node_id()
+    rows.append(XbillClosure(
+        ancestor_id=ancestor_id,
+        node_id=node.node_id(),
+        child_id=child_id,
+        depth=depth,
+        path=path,
+        quantity=quantity,
+    ))
+    if child_id in above:
+        return
+    above.append(child_id)
+    explode_xbill_closure_children(child_id, children, ancestor_id, depth+1, path, quantity, rows, above)
+    above.pop()
+
+def explode_xbill_closure_children(child_id, children, ancestor_id, depth, path, quantity, rows, above):
+    """
+    explode_xbill_closure for each child of the xbill object
+    ``child_id``, at ``depth`` below ``path`` ("" for the top).
+    """
+    kids = children.get(child_id, [])
+    if len(kids) > XBILL_CLOSURE_MAX_SIBLINGS:
+        raise XbillClosureLimitError("More than %s children" % XBILL_CLOSURE_MAX_SIBLINGS)
+    for i, kid in enumerate(kids):
+        kid_path = "%04d" % i
+        if path:
+            kid_path = ".".join([path, kid_path])
+        explode_xbill_closure(kid, children, ancestor_id, depth, kid_path, quantity, rows, above)
+
+def closure_rows(resource_type_id, graph):
+    """
+    The XbillClosure rows of the bill of ``resource_type_id``, from
+    ``graph``, or none if the bill is past the closure's limits: its
+    bill is then built without the closure, see closure_xbill.
+    """
+    rows = []
+    child_id = "-".join(["ResourceType", str(resource_type_id)])
+    try:
+        explode_xbill_closure_children(child_id, graph.children, resource_type_id,
+            1, "", Decimal("1"), rows, [child_id])
+    except XbillClosureLimitError:
+        return []
+    return rows
+
+def rebuild_xbill_closure(resource_type):
+    graph = XbillGraph(resource_type)
+    rows = closure_rows(resource_type.id, graph)
+    XbillClosure.objects.filter(ancestor=resource_type).delete()
+    for batch in chunks(rows, 100):
+        XbillClosure.objects.bulk_create(batch)
+    bump_xbill_versions([resource_type.id])
+    return rows
+
+def xbill_where_used(resource_type):
+    """
+    The resource types whose extended bill uses ``resource_type``,
+    directly or further down, in one query on the XbillClosure table.
+    Each is annotated with ``where_used_depth``, the shallowest level
+    it is used at, and ``where_used_quantity``, how much of it one unit
+    takes over all its uses (an option counting as one of each).
+    Only bills whose closure has been built are found, see
+    ``manage.py rebuild_xbill_closure``.
+    """
+    return EconomicResourceType.objects.filter(
+        xbill_descendants__child_id=resource_type.node_id()).annotate(
+        where_used_depth=Min('xbill_descendants__depth'),
+        where_used_quantity=Sum('xbill_descendants__quantity')).order_by('name')
+
+def xbill_ancestor_ids(xbill_objects):
+    """
+    Returns the ids of the resource types whose extended bill
+    contains any of ``xbill_objects``, plus the resource types among them.
+    """
+    ids = set(obj.id for obj in xbill_objects if isinstance(obj, EconomicResourceType))
+    for batch in chunks([obj.node_id() for obj in xbill_objects]):
+        ids.update(XbillClosure.objects.filter(
+            child_id__in=batch).values_list('ancestor', flat=True))
+    return ids
+
+# per-thread state of closure maintenance: the resource types being
+# deleted, whose rows must not be rebuilt by the cascade deleting their
+# xbill nodes, whether maintenance is suspended, and the changes
+# collected by xbill_closure_deferred
+xbill_closure_state = threading.local()
+
+def deleting_resource_type_ids():
+    if not hasattr(xbill_closure_state, "deleting"):
+        xbill_closure_state.deleting = set()
+    return xbill_closure_state.deleting
+
+@contextmanager
+def xbill_closure_suspended():
+    """
+    Suspends closure maintenance in this thread, for loading many
+    recipe rows at once.  Rebuild the affected bills afterwards.
+    """
+    xbill_closure_state.suspended = True
+    try:
+        yield
+    finally:
+        xbill_closure_state.suspended = False
+
+@contextmanager
+def xbill_closure_deferred():
+    """
+    Collects the xbill nodes changed in this thread and updates the
+    closure, and the xbill versions, once at the end instead of on
+    every save.
+    """
+    if hasattr(xbill_closure_state, "changes"):
+        yield
+        return
+    xbill_closure_state.changes = []
+    try:
+        yield
+    finally:
+        changes = xbill_closure_state.changes
+        del xbill_closure_state.changes
+    bump_xbill_versions(update_xbill_closures(changes))
+
+def defers_xbill_closure(func):
+    """Runs ``func`` in xbill_closure_deferred, e.g. a view saving many options."""
+    def wrapper(*args, **kwargs):
+        with xbill_closure_deferred():
+            return func(*args, **kwargs)
+    wrapper.__name__ = func.__name__
+    wrapper.__doc__ = func.__doc__
+    return wrapper
+
+def update_xbill_closure(node):
+    """
+    Updates the XbillClosure rows of every resource type whose bill
+    contained ``node`` or contains its xbill parent object now.
+    Returns the ids of the resource types whose rows changed, and
+    always the resource type ``node`` hangs from, whose bill may have
+    had no rows yet (only that one while suspended or deferred, see
+    xbill_closure_deferred).
+    """
+    try:
+        parent_id = node.xbill_parent_object().node_id()
+    except (ObjectDoesNotExist, AttributeError):
+        # parent already deleted or relationship not set
+        parent_id = None
+    top = set()
+    if parent_id:
+        kind, pk = parent_id.rsplit("-", 1)
+        if kind == "ResourceType":
+            top.add(int(pk))
+    if getattr(xbill_closure_state, "suspended", False):
+        return top
+    change = (node.node_id(), parent_id, set(deleting_resource_type_ids()))
+    if hasattr(xbill_closure_state, "changes"):
+        xbill_closure_state.changes.append(change)
+        return top
+    return update_xbill_closures([change]) | top
+
+def update_xbill_closures(changes):
+    """
+    Updates the XbillClosure rows for ``changes``, a list of (node id,
+    parent node id, ids of resource types being deleted), and returns
+    the ids of the resource types whose rows changed.
+
+    Only the rows below the changed node's parent are replaced, under
+    each path the parent has in a bill: where the node was, and where
+    its parent is now.  A bill whose top the node hangs from is
+    rebuilt whole.  Everything below the parents is loaded in one
+    XbillGraph.
+    """
+    # {ancestor id: set of paths to rebuild below, "" for the whole bill}
+    prefixes = {}
+    for node_id, parent_id, deleting in changes:
+        found = {}
+        for ancestor_id, path in XbillClosure.objects.filter(
+                node_id=node_id).values_list("ancestor", "path"):
+            found.setdefault(ancestor_id, set()).add(path.rpartition(".")[0])
+        if parent_id:
+            for ancestor_id, path in XbillClosure.objects.filter(
+                    child_id=parent_id).values_list("ancestor", "path"):
+                found.setdefault(ancestor_id, set()).add(path)
+            kind, pk = parent_id.rsplit("-", 1)
+            if kind == "ResourceType":
+                found.setdefault(int(pk), set()).add("")
+        for ancestor_id, paths in found.items():
+            if not ancestor_id in deleting:
+                prefixes.setdefault(ancestor_id, set()).update(paths)
+    whole = set(EconomicResourceType.objects.filter(id__in=[ancestor_id
+        for ancestor_id, paths in prefixes.items() if "" in paths]).values_list("id", flat=True))
+    # the top path of each subtree, with the child id and quantity there
+    # and the child ids above it, for cycles
+    tops = {}
+    for ancestor_id, paths in prefixes.items():
+        if ancestor_id in whole or "" in paths:
+            continue
+        paths = sorted(paths)
+        outer = []
+        for path in paths:
+            if not [top for top in outer if path.startswith(top + ".")]:
+                outer.append(path)
+        above_paths = set()
+        for path in outer:
+            parts = path.split(".")
+            above_paths.update(".".join(parts[:i]) for i in range(1, len(parts) + 1))
+        rows = {}
+        for batch in chunks(above_paths):
+            for path, child_id, depth, quantity in XbillClosure.objects.filter(
+                    ancestor__id=ancestor_id, path__in=batch).values_list(
+                    "path", "child_id", "depth", "quantity"):
+                rows[path] = (child_id, depth, quantity)
+        ancestor_node_id = "-".join(["ResourceType", str(ancestor_id)])
+        for path in outer:
+            if path in rows:
+                parts = path.split(".")
+                above = [ancestor_node_id] + [rows[".".join(parts[:i])][0]
+                    for i in range(1, len(parts) + 1) if ".".join(parts[:i]) in rows]
+                tops[(ancestor_id, path)] = rows[path] + (above,)
+
+    graph = XbillGraph()
+    graph.load(["-".join(["ResourceType", str(rt_id)]) for rt_id in whole]
+        + [top[0] for top in tops.values()])
+    for ancestor_id in whole:
+        rows = closure_rows(ancestor_id, graph)
+        XbillClosure.objects.filter(ancestor__id=ancestor_id).delete()
+        for batch in chunks(rows, 100):
+            XbillClosure.objects.bulk_create(batch)
+    # bills that went past the closure's limits, now without rows
+    emptied = set()
+    for (ancestor_id, path), (child_id, depth, quantity, above) in tops.items():
+        if ancestor_id in emptied:
+            continue
+        rows = []
+        # the top itself may close a cycle, and so have nothing below
+        if not child_id in above[:-1]:
+            try:
+                explode_xbill_closure_children(child_id, graph.children, ancestor_id,
+                    depth + 1, path, quantity, rows, above)
+            except XbillClosureLimitError:
+                XbillClosure.objects.filter(ancestor__id=ancestor_id).delete()
+                emptied.add(ancestor_id)
+                continue
+        XbillClosure.objects.filter(ancestor__id=ancestor_id,
+            path__startswith=path + ".").delete()
+        for batch in chunks(rows, 100):
+            XbillClosure.objects.bulk_create(batch)
+    return whole | set(ancestor_id for ancestor_id, path in tops)
+
+XBILL_CACHE_TIMEOUT = getattr(settings, "XBILL_CACHE_TIMEOUT", 60 * 60 * 24)
+
+def xbill_version_name(resource_type_id):
+    return "xbill-%s" % resource_type_id
+
+def xbill_version(resource_type_id):
+    """
+    The current version of the extended bill of a resource type,
+    bumped by bump_xbill_versions.
+    """
+    return xbill_versions([resource_type_id])[resource_type_id]
+
+def xbill_versions(resource_type_ids):
+    names = dict((rt_id, xbill_version_name(rt_id)) for rt_id in resource_type_ids)
+    versions = cache_versions(names.values())
+    return dict((rt_id, versions[name]) for rt_id, name in names.items())
+
+def bump_xbill_versions(resource_type_ids):
+    bump_cache_versions([xbill_version_name(rt_id) for rt_id in resource_type_ids])
+
+XBILL_CHOICES_NAME = "xbill-choices"
+
+def xbill_choices():
+    """
+    The agent and resource type choice lists of the recipe editor's
+    forms, as lists of [id, name] (resource types with their category
+    id too).  Cached until an agent or resource type changes, see the
+    signal handlers in models.
+    """
+    key = "xbill-choices-%s" % cache_versions([XBILL_CHOICES_NAME])[XBILL_CHOICES_NAME]
+    choices = cache.get(key)
+    if choices is None:
+        choices = {
+            "agents": [list(agent) for agent in
+                EconomicAgent.objects.values_list("id", "name")],
+            "resource_types": [list(rt) for rt in
+                EconomicResourceType.objects.values_list("id", "name", "category")],
+            "types_of_work": [list(rt) for rt in
+                EconomicResourceType.objects.types_of_work().values_list("id", "name")],
+        }
+        cache.set(key, choices, XBILL_CACHE_TIMEOUT)
+    return choices
+
+def clear_xbill_choices():
+    bump_cache_versions([XBILL_CHOICES_NAME])
+
+def count_xbill_cache(name):
+    key = "xbill-cache-%s" % name
+    cache.add(key, 0, XBILL_CACHE_TIMEOUT)
+    try:
+        cache.incr(key)
+    except ValueError:
+        pass
+
+def xbill_cache_stats():
+    return {
+        "hits": cache.get("xbill-cache-hits", 0),
+        "misses": cache.get("xbill-cache-misses", 0),
+    }
+
+def cached_xbill(resource_type, depth_limit=None, categories=None):
+    """
+    The extended bill of ``resource_type``, cached under its
+    xbill_version.  Edits bump the version of every bill containing
+    them (see the signal handlers in models), so stale trees are
+    simply never read again.
+
+    Limited bills (see generate_xbill) are cached per limits.
+    """
+    key = "xbill-%s-%s" % (resource_type.id, xbill_version(resource_type.id))
+    if depth_limit is not None or categories:
+        limits = u"%s:%s" % (depth_limit, u",".join(sorted(categories or [])))
+        key = "-".join([key, hashlib.md5(limits.encode("utf-8")).hexdigest()])
+    nodes = cache.get(key)
+    if nodes is None:
+        count_xbill_cache("misses")
+        if depth_limit is not None or categories:
+            nodes = generate_xbill(resource_type, depth_limit, categories)
+        else:
+            nodes = closure_xbill(resource_type)
+        cache.set(key, nodes, XBILL_CACHE_TIMEOUT)
+    else:
+        count_xbill_cache("hits")
+    return nodes
+
+def explode_requirements(resource_type, graph, options, memo, path):
+    """
+    Returns {resource type id: (resource type, quantity)} of the leaf
+    resource types that one unit of ``resource_type`` takes, walking
+    ``graph``, an XbillGraph containing it.
+    ``memo`` keeps the result per resource type, so a shared
+    subassembly is exploded once; ``path`` catches cycles.
+    """
+    if resource_type.id in memo:
+        return memo[resource_type.id]
+    check_xbill_cycle(path, resource_type)
+    producers = [node for node in graph.xbill_children(resource_type)
+        if isinstance(node, ProcessTypeResourceType)]
+    if not producers:
+        requirements = {resource_type.id: (resource_type, Decimal("1"))}
+    else:
+        requirements = {}
+        # the main producing process type, as in create_order
+        process_type = producers[0].process_type
+        components = []
+        for kid in graph.xbill_children(process_type):
+            if isinstance(kid, Feature):
+                for option in graph.xbill_children(kid):
+                    if option.id in options:
+                        components.append((option.component, kid.quantity))
+            else:
+                components.append((kid.resource_type, kid.quantity))
+        path.extend([resource_type, process_type])
+        for component, quantity in components:
+            for rt_id, (rt, qty) in explode_requirements(component, graph, options, memo, path).items():
+                if rt_id in requirements:
+                    qty = requirements[rt_id][1] + quantity * qty
+                else:
+                    qty = quantity * qty
+                requirements[rt_id] = (rt, qty)
+        del path[-2:]
+    memo[resource_type.id] = requirements
+    return requirements
+
+def flattened_requirements(resource_type, options=None):
+    """
+    The flattened bill of ``resource_type``: every leaf resource type
+    (one that no process type here produces) that one unit of it takes,
+    with the ProcessTypeResourceType and Feature quantities multiplied
+    down each path and summed over paths.
+    ``options`` are the ids of the selected Options; features with no
+    selected option are left out.
+    Returns a list of (resource type, quantity) sorted by name.
+    """
+    graph = XbillGraph(resource_type)
+    requirements = explode_requirements(
+        resource_type, graph, set(options or []), {}, [])
+    return sorted(requirements.values(), key=lambda req: req[0].name)
+
+def cached_flattened_requirements(resource_type, options=None):
+    """
+    flattened_requirements, cached per selected options under the
+    xbill_version of ``resource_type``, like cached_xbill.
+    """
+    options = sorted(set(options or []))
+    selected = hashlib.md5(",".join(str(option) for option in options)).hexdigest()
+    key = "flattened-bill-%s-%s-%s" % (
+        resource_type.id, xbill_version(resource_type.id), selected)
+    requirements = cache.get(key)
+    if requirements is None:
+        requirements = flattened_requirements(resource_type, options)
+        cache.set(key, requirements, XBILL_CACHE_TIMEOUT)
+    return requirements
+
+# "cheapest" or "first": which way of getting a resource type the
+# cost rollup uses when there are several
+XBILL_COST_PRODUCER = getattr(settings, "XBILL_COST_PRODUCER", "cheapest")
+
+def xbill_cost_key(resource_type_id, version):
+    return "xbill-cost-%s-%s" % (resource_type_id, version)
+
+def explode_cost(resource_type, graph, memo, path, producer=XBILL_COST_PRODUCER):
+    """
+    The cost of one unit of ``resource_type``, walking ``graph``, an
+    XbillGraph containing it.  A process type costs its inputs plus
+    the cheapest option of each feature; a source costs its value.
+    Of several process types and sources with a cost, the cheapest
+    or the first one is used, per ``producer``.  A resource type
+    without any costs its rate.
+    ``memo`` keeps the cost per resource type id, so a shared
+    subassembly is costed once; ``path`` catches cycles.
+    """
+    if resource_type.id in memo:
+        return memo[resource_type.id]
+    check_xbill_cycle(path, resource_type)
+    path.append(resource_type)
+    costs = []
+    for kid in graph.xbill_children(resource_type):
+        if isinstance(kid, ProcessTypeResourceType):
+            process_type = kid.process_type
+            path.append(process_type)
+            cost = Decimal("0")
+            for pt_kid in graph.xbill_children(process_type):
+                if isinstance(pt_kid, Feature):
+                    option_costs = [explode_cost(option.component, graph, memo, path, producer)
+                        for option in graph.xbill_children(pt_kid)]
+                    if option_costs:
+                        cost += pt_kid.quantity * min(option_costs)
+                else:
+                    cost += pt_kid.quantity * explode_cost(pt_kid.resource_type, graph, memo, path, producer)
+            path.pop()
+            costs.append(cost)
+        elif kid.value:
+            costs.append(kid.value)
+    path.pop()
+    if not costs:
+        cost = resource_type.rate
+    elif producer == "first":
+        cost = costs[0]
+    else:
+        cost = min(costs)
+    memo[resource_type.id] = cost
+    return cost
+
+def xbill_cost(resource_type):
+    """
+    The rolled up cost of one unit of ``resource_type`` (see
+    explode_cost).  Every resource type's cost is cached under its
+    xbill_version, which changes with its rate, its sources and
+    anything in its bill, so after a change only the costs of the
+    resource types above it are recomputed, and the bill is only
+    loaded down to the resource types whose cost is still cached.
+    """
+    version = xbill_version(resource_type.id)
+    keys = {resource_type.id: xbill_cost_key(resource_type.id, version)}
+    cost = cache.get(keys[resource_type.id])
+    if cost is not None:
+        return cost
+    memo = {}
+
+    def cached_costs(rt_ids):
+        level_keys = dict((rt_id, xbill_cost_key(rt_id, version))
+            for rt_id, version in xbill_versions(rt_ids).items())
+        keys.update(level_keys)
+        cached = cache.get_many(level_keys.values())
+        found = set()
+        for rt_id, key in level_keys.items():
+            if key in cached:
+                memo[rt_id] = cached[key]
+                found.add(rt_id)
+        return found
+
+    graph = XbillGraph(resource_type, prune=cached_costs)
+    known = set(memo)
+    cost = explode_cost(resource_type, graph, memo, [])
+    cache.set_many(dict((keys[rt_id], memo[rt_id])
+        for rt_id in memo if rt_id not in known and rt_id in keys),
+        XBILL_CACHE_TIMEOUT)
+    return cost
+
 
 #adapted from threaded_comments.util
 def annotate_tree_properties(nodes):
@@ -1,4 +1,5 @@
 import datetime
+import hashlib
 import time
 import csv
 from operator import attrgetter
@@ -11,9 +12,11 @@ from django.shortcuts import render_to_response, get_object_or_404
 from django.core.urlresolvers import reverse
 from django.contrib.auth.models import User
 from django.template import RequestContext
-from django.http import HttpResponse, HttpResponseServerError
+from django.http import HttpResponse, HttpResponseServerError, HttpResponseBadRequest
 from django.core import serializers
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.http import condition
+from django.contrib import messages
 from django.core.exceptions import MultipleObjectsReturned
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.utils import simplejson
@@ -231,42 +234,61 @@ def extended_bill(request, resource_type_id):
     rt = get_object_or_404(EconomicResourceType, pk=resource_type_id)
     #import pdb; pdb.set_trace()
     select_all = True
+    lazy = False
     categories = Category.objects.all()
     if request.method == "POST":
-        nodes = generate_xbill(rt)
-        depth = 1
-        for node in nodes:
-            depth = max(depth, node.depth)
         selected_cats = request.POST["categories"]
         cats = selected_cats.split(",")
         selected_depth = int(request.POST['depth'])
+        depth = int(request.POST.get('max_depth', selected_depth))
         #import pdb; pdb.set_trace()
         if cats[0]:
             if cats[0] == "all":
                 select_all = True
             else:
                 select_all = False
-        for node in nodes:
-            node.show = False
-            if node.depth <= selected_depth:
-                if select_all:
-                    node.show = True
-                else:
-                    cat = node.category()
-                    if cat.name in cats:
-                        node.show = True
+        depth_limit = None
+        if selected_depth < depth:
+            depth_limit = selected_depth
+        try:
+            if select_all:
+                nodes = cached_xbill(rt, depth_limit)
+            else:
+                nodes = cached_xbill(rt, depth_limit, cats)
+        except XbillCycleError, e:
+            messages.error(request, unicode(e))
+            nodes = []
     else:
-        nodes = generate_xbill(rt)
-        depth = 1
-        for node in nodes:
-            depth = max(depth, node.depth)
-            node.show = True
+        size, depth = xbill_size(rt)
+        lazy = request.GET.get("lazy")
+        if lazy is None:
+            lazy = size > XBILL_LAZY_NODES
+        else:
+            lazy = lazy not in ("0", "false")
+        try:
+            if lazy:
+                nodes = lazy_xbill(rt)
+            else:
+                nodes = cached_xbill(rt)
+                depth = 1
+                for node in nodes:
+                    depth = max(depth, node.depth)
+        except XbillCycleError, e:
+            messages.error(request, unicode(e))
+            nodes = []
+        depth = max(depth, 1)
         selected_depth = depth
         select_all = True
         selected_cats = "all"
+    try:
+        cost = xbill_cost(rt)
+    except XbillCycleError:
+        cost = None
     return render_to_response("valueaccounting/extended_bill.html", {
         "resource_type": rt,
         "nodes": nodes,
+        "lazy": lazy,
+        "cost": cost,
         "depth": depth,
         "selected_depth": selected_depth,
         "categories": categories,
@@ -280,12 +302,14 @@ def extended_bill(request, resource_type_id):
 def edit_extended_bill(request, resource_type_id):
     rt = get_object_or_404(EconomicResourceType, pk=resource_type_id)
     #import pdb; pdb.set_trace()
-    nodes = generate_xbill(rt)
+    try:
+        nodes = cached_xbill(rt)
+    except XbillCycleError, e:
+        messages.error(request, unicode(e))
+        nodes = []
     resource_type_form = EconomicResourceTypeForm(instance=rt)
     process_form = XbillProcessTypeForm()
     change_process_form = ChangeProcessTypeForm()
-    source_form = AgentResourceTypeForm()
-    feature_form = FeatureForm()
     return render_to_response("valueaccounting/edit_xbill.html", {
         "resource_type": rt,
         "nodes": nodes,
@@ -294,8 +318,58 @@ def edit_extended_bill(request, resource_type_id):
         "resource_type_form": resource_type_form,
         "process_form": process_form,
         "change_process_form": change_process_form,
-        "source_form": source_form,
-        "feature_form": feature_form,
+    }, context_instance=RequestContext(request))
+
+# the per-node forms of edit_xbill.html, fetched by xbill_form
+# as their modals are opened: model and how to make the form
+XBILL_FORMS = {
+    "process-type": (EconomicResourceType, lambda rt: XbillProcessTypeForm()),
+    "source": (EconomicResourceType, lambda rt: AgentResourceTypeForm()),
+    "change-process-type": (ProcessType, lambda pt: pt.xbill_change_form()),
+    "input": (ProcessType, lambda pt: pt.xbill_input_form()),
+    "feature": (ProcessType, lambda pt: FeatureForm()),
+    "change-input": (ProcessTypeResourceType, lambda ptrt: ptrt.xbill_change_form()),
+    "change-source": (AgentResourceType, lambda art: art.xbill_change_form()),
+    "change-feature": (Feature, lambda feature: feature.xbill_change_form()),
+    "options": (Feature, lambda feature: feature.options_form()),
+    "change-options": (Feature, lambda feature: feature.options_change_form()),
+}
+
+def defer_choices(form):
+    """
+    Leaves only the current value in the agent and resource type
+    selects of ``form``, marked with the json_xbill_choices list
+    the page fills them from, and the blank choice of those that
+    may be left empty.
+    """
+    choices = xbill_choices()
+    if isinstance(form, LaborInputForm):
+        rt_choices = "types_of_work"
+    else:
+        rt_choices = "resource_types"
+    for name, list_name in (("agent", "agents"), ("resource_type", rt_choices)):
+        if name in form.fields:
+            field = form.fields[name]
+            widget = field.widget
+            value = form.initial.get(name)
+            widget.choices = []
+            if not field.required:
+                widget.choices.append(("", getattr(field, "empty_label", None) or u"---------"))
+            if value:
+                labels = dict((choice[0], choice[1]) for choice in choices[list_name])
+                widget.choices.append((value, labels.get(value, value)))
+            widget.attrs["data-choices"] = list_name
+
+@login_required
+def xbill_form(request, form_name, object_id):
+    if not form_name in XBILL_FORMS:
+        raise Http404
+    model, make_form = XBILL_FORMS[form_name]
+    xbill_object = get_object_or_404(model, pk=object_id)
+    form = make_form(xbill_object)
+    defer_choices(form)
+    return render_to_response("valueaccounting/_xbill_form.html", {
+        "form": form,
     }, context_instance=RequestContext(request))
 
 @login_required
@@ -322,11 +396,13 @@ def change_resource_type(request, resource_type_id):
 def delete_resource_type_confirmation(request, resource_type_id):
     rt = get_object_or_404(EconomicResourceType, pk=resource_type_id)
     side_effects = False
-    if rt.process_types.all():
+    used_in = list(xbill_where_used(rt))
+    if rt.process_types.all() or rt.options.all() or used_in:
         side_effects = True
         return render_to_response('valueaccounting/resource_type_delete_confirmation.html', {
             "resource_type": rt,
             "side_effects": side_effects,
+            "used_in": used_in,
             }, context_instance=RequestContext(request))
     else:
         rt.delete()
@@ -334,6 +410,7 @@ def delete_resource_type_confirmation(request, resource_type_id):
             % ('accounting/resources'))
 
 @login_required
+@defers_xbill_closure
 def delete_resource_type(request, resource_type_id):
     #import pdb; pdb.set_trace()
     if request.method == "POST":
@@ -456,6 +533,7 @@ def delete_feature_confirmation(request,
 
 
 @login_required
+@defers_xbill_closure
 def delete_process_type(request, process_type_id):
     #import pdb; pdb.set_trace()
     if request.method == "POST":
@@ -469,6 +547,7 @@ def delete_process_type(request, process_type_id):
                 % ('accounting/resources'))
 
 @login_required
+@defers_xbill_closure
 def delete_feature(request, feature_id):
     #import pdb; pdb.set_trace()
     if request.method == "POST":
@@ -556,6 +635,7 @@ def create_options_for_feature(request, feature_id):
             raise ValidationError(form.errors)
 
 @login_required
+@defers_xbill_closure
 def change_options_for_feature(request, feature_id):
     #import pdb; pdb.set_trace()
     if request.method == "POST":
@@ -692,10 +772,22 @@ def create_process_type_for_resource_type(request, resource_type_id):
         else:
             raise ValidationError(form.errors)
 
+def where_used(request, resource_type_id):
+    rt = get_object_or_404(EconomicResourceType, pk=resource_type_id)
+    used_in = xbill_where_used(rt)
+    return render_to_response("valueaccounting/where_used.html", {
+        "resource_type": rt,
+        "used_in": used_in,
+        "photo_size": (128, 128),
+    }, context_instance=RequestContext(request))
+
 def network(request, resource_type_id):
     #import pdb; pdb.set_trace()
     rt = get_object_or_404(EconomicResourceType, pk=resource_type_id)
     nodes, edges = graphify(rt, 3)
+    layout = cached_network_layout(rt, 3, nodes, edges)
+    for node in nodes:
+        node.layout_x, node.layout_y = layout[node.node_id()]
     return render_to_response("valueaccounting/network.html", {
         "resource_type": rt,
         "photo_size": (128, 128),
@@ -703,6 +795,40 @@ def network(request, resource_type_id):
         "edges": edges,
     }, context_instance=RequestContext(request))
 
+AGENT_NETWORK_MAX_HOPS = 4
+
+def agent_network_view(request, agent_id):
+    agent = get_object_or_404(EconomicAgent, pk=agent_id)
+    try:
+        hops = min(max(int(request.GET.get("hops", 2)), 1), AGENT_NETWORK_MAX_HOPS)
+    except ValueError:
+        hops = 2
+    nodes, edges = cached_agent_network(agent, hops)
+    return render_to_response("valueaccounting/agent_network.html", {
+        "agent": agent,
+        "hops": hops,
+        "hop_choices": range(1, AGENT_NETWORK_MAX_HOPS + 1),
+        "photo_size": (128, 128),
+        "nodes": nodes,
+        "edges": edges,
+    }, context_instance=RequestContext(request))
+
+def network_metrics(request):
+    metrics = NetworkMetric.objects.select_related("agent", "resource_type")
+    if request.GET.get("order") == "betweenness":
+        metrics = metrics.order_by("-betweenness")
+    return render_to_response("valueaccounting/network_metrics.html", {
+        "metrics": metrics[:100],
+    }, context_instance=RequestContext(request))
+
+def network_export(request, format):
+    if not format in NETWORK_EXPORT_FORMATS:
+        raise Http404
+    response = HttpResponse(export_network(format),
+        mimetype=NETWORK_EXPORT_FORMATS[format])
+    response["Content-Disposition"] = "attachment; filename=network.%s" % format
+    return response
+
 def timeline(request):
     timeline_date = datetime.date.today().strftime("%b %e %Y 00:00:00 GMT-0600")
     unassigned = Commitment.objects.filter(
@@ -713,20 +839,139 @@ def timeline(request):
         "unassigned": unassigned,
     }, context_instance=RequestContext(request))
 
+def timeline_last_modified(request):
+    if not hasattr(request, "timeline_last_changed"):
+        request.timeline_last_changed = timeline_last_changed()
+    return request.timeline_last_changed
+
+def timeline_etag(request):
+    stamp = timeline_stamp(timeline_last_modified(request)) or ""
+    return hashlib.md5("|".join([stamp, request.META.get("QUERY_STRING", "")])).hexdigest()
+
+@condition(etag_func=timeline_etag, last_modified_func=timeline_last_modified)
 def json_timeline(request):
-    #data = "{ 'wiki-url':'http://simile.mit.edu/shelf/', 'wiki-section':'Simile JFK Timeline', 'dateTimeFormat': 'Gregorian','events': [{'start':'May 28 2006 09:00:00 GMT-0600','title': 'Writing Timeline documentation','link':'http://google.com','description':'Write some doc already','durationEvent':false }, {'start': 'Jun 16 2006 00:00:00 GMT-0600' ,'end':  'Jun 26 2006 00:00:00 GMT-0600' ,'durationEvent':true,'title':'Friends wedding'}]}"
-    #import pdb; pdb.set_trace()
-    orders = Order.objects.all()
-    #processes = []
-    #for order in orders:
-    #    for commitment in order.producing_commitments():
-    #        processes.append(commitment.process)
-    events = {'dateTimeFormat': 'Gregorian','events':[]}
-    #for process in processes:
-    #    backschedule_events(process, events)
-    for order in orders:
-        backschedule_order(order, events)
-    data = simplejson.dumps(events, ensure_ascii=False)
+    """
+    The timeline events in the ?start= and ?end= window (YYYY-MM-DD),
+    optionally of one ?order= or the orders of an ?agent=, ?limit= events
+    at a time.  "next" is the ?cursor= of the next page.
+    With ?since= a previous response's "stamp", only the events of the
+    orders changed since, listed in "changed_orders": their earlier
+    events are out of date.
+    """
+    try:
+        start = end = since = None
+        if request.GET.get("start"):
+            start = datetime.datetime.strptime(request.GET["start"], "%Y-%m-%d").date()
+        if request.GET.get("end"):
+            end = datetime.datetime.strptime(request.GET["end"], "%Y-%m-%d").date()
+        if request.GET.get("since"):
+            since = parse_timeline_stamp(request.GET["since"])
+        limit = min(int(request.GET.get("limit", TIMELINE_PAGE_SIZE)), TIMELINE_MAX_PAGE_SIZE)
+        entries = timeline_entries(start, end,
+            int(request.GET.get("order", 0)), int(request.GET.get("agent", 0)), since)
+        entries, next_cursor = timeline_page(entries, request.GET.get("cursor"), max(limit, 1))
+    except ValueError:
+        return HttpResponseBadRequest("bad date, id, limit, cursor or stamp")
+    extra = {
+        "next": next_cursor,
+        "stamp": timeline_stamp(timeline_last_modified(request)),
+    }
+    if since:
+        extra["changed_orders"] = list(timeline_changed_orders(since))
+    rows = entries.values_list(*TIMELINE_ROW_FIELDS).iterator()
+    return HttpResponse(stream_timeline_json(rows, **extra),
+        mimetype="text/json-comment-filtered")
+
+def json_xbill_cache_stats(request):
+    data = simplejson.dumps(xbill_cache_stats())
+    return HttpResponse(data, mimetype="text/json-comment-filtered")
+
+def json_xbill_children(request, node_id):
+    try:
+        depth = int(request.GET.get("depth", 1))
+    except ValueError:
+        return HttpResponseBadRequest("bad depth")
+    nodes = xbill_expand(node_id, depth)
+    if nodes is None:
+        raise Http404
+    data = simplejson.dumps([node.dictify() for node in nodes], ensure_ascii=False)
+    return HttpResponse(data, mimetype="text/json-comment-filtered")
+
+def json_where_used(request, resource_type_id):
+    rt = get_object_or_404(EconomicResourceType, pk=resource_type_id)
+    used_in = []
+    for product in xbill_where_used(rt):
+        used_in.append({
+            "id": product.id,
+            "name": product.name,
+            "depth": product.where_used_depth,
+            "quantity": str(product.where_used_quantity),
+        })
+    data = simplejson.dumps(used_in, ensure_ascii=False)
+    return HttpResponse(data, mimetype="text/json-comment-filtered")
+
+def flattened_bill_request(request, resource_type_id):
+    rt = get_object_or_404(EconomicResourceType, pk=resource_type_id)
+    quantity = Decimal(request.GET.get("quantity") or "1")
+    options = request.GET.get("options")
+    if options:
+        options = [int(option) for option in options.split(",")]
+    requirements = cached_flattened_requirements(rt, options)
+    return rt, [(component, qty * quantity) for component, qty in requirements]
+
+def json_flattened_bill(request, resource_type_id):
+    try:
+        rt, requirements = flattened_bill_request(request, resource_type_id)
+    except (InvalidOperation, ValueError):
+        return HttpResponseBadRequest("bad quantity or options")
+    except XbillCycleError, e:
+        return HttpResponseBadRequest(unicode(e))
+    items = []
+    for component, quantity in requirements:
+        items.append({
+            "id": component.id,
+            "name": component.name,
+            "quantity": str(quantity),
+            "unit": component.unit and component.unit.abbrev or "",
+        })
+    data = simplejson.dumps(items, ensure_ascii=False)
+    return HttpResponse(data, mimetype="text/json-comment-filtered")
+
+def flattened_bill_csv(request, resource_type_id):
+    try:
+        rt, requirements = flattened_bill_request(request, resource_type_id)
+    except (InvalidOperation, ValueError):
+        return HttpResponseBadRequest("bad quantity or options")
+    except XbillCycleError, e:
+        return HttpResponseBadRequest(unicode(e))
+    response = HttpResponse(mimetype="text/csv")
+    response["Content-Disposition"] = "attachment; filename=%s-bill.csv" % rt.id
+    writer = csv.writer(response)
+    writer.writerow(["id", "name", "quantity", "unit"])
+    for component, quantity in requirements:
+        writer.writerow([
+            component.id,
+            component.name.encode("utf-8"),
+            quantity,
+            component.unit and component.unit.abbrev.encode("utf-8") or "",
+        ])
+    return response
+
+def json_resource_type_cost(request, resource_type_id):
+    rt = get_object_or_404(EconomicResourceType, pk=resource_type_id)
+    try:
+        cost = xbill_cost(rt)
+    except XbillCycleError, e:
+        return HttpResponseBadRequest(unicode(e))
+    data = simplejson.dumps({
+        "id": rt.id,
+        "name": rt.name,
+        "cost": str(cost),
+    }, ensure_ascii=False)
+    return HttpResponse(data, mimetype="text/json-comment-filtered")
+
+def json_xbill_choices(request):
+    data = simplejson.dumps(xbill_choices(), ensure_ascii=False)
     return HttpResponse(data, mimetype="text/json-comment-filtered")
 
 def json_resource_type_unit(request, resource_type_id):
@@ -734,6 +979,7 @@ def json_resource_type_unit(request, resource_type_id):
     return HttpResponse(data, mimetype="text/json-comment-filtered")
 
 @login_required
+@defers_timeline
 def create_order(request):
     cats = Category.objects.filter(orderable=True)
     rts = EconomicResourceType.objects.filter(category__in=cats)
@@ -752,101 +998,26 @@ def create_order(request):
     if request.method == "POST":
         if order_form.is_valid():
             order = order_form.save()
-            #import pdb; pdb.set_trace()
+            lines = []
             for form in item_forms:
                 if form.is_valid():
                     data = form.cleaned_data
                     qty = data["quantity"]
                     if qty:
-                        rt_id = data["resource_type_id"]
-                        rt = EconomicResourceType.objects.get(id=rt_id)
-                        pt = rt.main_producing_process_type()
-                        ptrt = rt.main_producing_process_type_relationship()
-
-                        start_date = order.due_date - datetime.timedelta(minutes=pt.estimated_duration)
-                        process = Process(
-                            name=pt.name,
-                            process_type=pt,
-                            project=pt.project,
-                            url=pt.url,
-                            end_date=order.due_date,
-                            start_date=start_date,
-                            owner=order.provider,
-                            managed_by=order.provider,
-                        )
-                        process.save()
-                        commitment = Commitment(
-                            order=order,
-                            independent_demand=order,
-                            event_type=ptrt.relationship.event_type,
-                            relationship=ptrt.relationship,
-                            due_date=order.due_date,
-                            from_agent_type=order.provider.agent_type,
-                            from_agent=order.provider,
-                            to_agent=order.receiver,
-                            resource_type=rt,
-                            process=process,
-                            project=pt.project,
-                            description=data["description"],
-                            quantity=qty,
-                            unit_of_quantity=rt.unit,
-                            created_by=request.user,
-                        )
-                        commitment.save()
+                        options = []
                         for ftr in form.features:
                             if ftr.is_valid():
-                                option_id = ftr.cleaned_data["options"]
-                                option = Option.objects.get(id=option_id)
-                                component = option.component
-                                feature = ftr.feature
-                                process_type = feature.process_type
-                                #import pdb; pdb.set_trace()
-                                if process_type != pt:
-                                    raise ValueError(process_type)
-                                commitment = Commitment(
-                                    independent_demand=order,
-                                    event_type=feature.relationship.event_type,
-                                    relationship=feature.relationship,
-                                    due_date=process.start_date,
-                                    to_agent=order.provider,
-                                    resource_type=component,
-                                    process=process,
-                                    project=pt.project,
-                                    quantity=qty * feature.quantity,
-                                    unit_of_quantity=component.unit,
-                                    created_by=request.user,
-                                )
-                                commitment.save()
-                                pptr = component.main_producing_process_type_relationship()
-                                if pptr:
-                                    next_pt = pptr.process_type
-                                    start_date = process.start_date - datetime.timedelta(minutes=next_pt.estimated_duration)
-                                    next_process = Process(          
-                                        name=next_pt.name,
-                                        process_type=next_pt,
-                                        project=next_pt.project,
-                                        url=next_pt.url,
-                                        end_date=process.start_date,
-                                        start_date=start_date,
-                                    )
-                                    next_process.save()
-                                    next_commitment = Commitment(
-                                        independent_demand=order,
-                                        event_type=pptr.relationship.event_type,
-                                        relationship=pptr.relationship,
-                                        due_date=process.start_date,
-                                        resource_type=pptr.resource_type,
-                                        process=next_process,
-                                        project=next_pt.project,
-                                        quantity=qty * feature.quantity,
-                                        unit_of_quantity=pptr.resource_type.unit,
-                                        created_by=request.user,
-                                    )
-                                    next_commitment.save()
-                                    generate_schedule(next_process, order, request.user)
-                        generate_schedule(process, order, request.user)
-                        return HttpResponseRedirect('/%s/%s/'
-                            % ('accounting/order-schedule', order.id))
+                                options.append(int(ftr.cleaned_data["options"]))
+                        lines.append({
+                            "resource_type": int(data["resource_type_id"]),
+                            "quantity": str(qty),
+                            "description": data["description"],
+                            "options": options,
+                        })
+            if lines:
+                queue_order_explosion(order, lines, request.user)
+            return HttpResponseRedirect('/%s/%s/'
+                % ('accounting/order-schedule', order.id))
                      
     return render_to_response("valueaccounting/create_order.html", {
         "order_form": order_form,
@@ -897,14 +1068,31 @@ def order_schedule(request, order_id):
     tools = []
     for ct in order.producing_commitments():
         schedule_commitment(ct, sked, reqs, work, tools, 0)
+    jobs = list(order.jobs.order_by("-created", "-id")[:1])
     return render_to_response("valueaccounting/order_schedule.html", {
         "order": order,
         "sked": sked,
         "reqs": reqs,
         "work": work,
         "tools": tools,
+        "critical_path": CriticalPath(order),
+        "job": jobs and jobs[0] or None,
+        "job_stale": jobs and order_job_stale(jobs[0]),
     }, context_instance=RequestContext(request))
 
+def json_order_job(request, order_id):
+    jobs = OrderJob.objects.filter(order__id=order_id).order_by("-created", "-id")[:1]
+    if not jobs:
+        raise Http404
+    data = jobs[0].dictify()
+    data["stale"] = order_job_stale(jobs[0])
+    return HttpResponse(simplejson.dumps(data), mimetype="text/json-comment-filtered")
+
+def json_critical_path(request, order_id):
+    order = get_object_or_404(Order, pk=order_id)
+    data = simplejson.dumps(CriticalPath(order).dictify())
+    return HttpResponse(data, mimetype="text/json-comment-filtered")
+
 def demand(request):
     orders = Order.objects.all()
     return render_to_response("valueaccounting/demand.html", {